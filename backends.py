@@ -0,0 +1,165 @@
+import json
+import os
+import shutil
+import subprocess
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+
+from catalog import CACHE_DIR
+from planner import parse_command
+
+BACKENDS_PATH = os.path.join(CACHE_DIR, 'backends.json')
+PROBE_TTL = 24 * 60 * 60
+PROBE_TIMEOUT = 15
+
+PROBES = {
+    'winget': ['winget', '--version'],
+    'brew': ['brew', '--version'],
+    'apt': ['apt', '--version'],
+    'snap': ['snap', '--version'],
+}
+
+# Package managers each platform uses; the first one is required
+OS_BACKENDS = {
+    'cmd': ['winget'],
+    'mac': ['brew'],
+    'linux': ['apt', 'snap'],
+}
+
+# Parsed command backend -> package manager that has to be present
+COMMAND_BACKENDS = {
+    'apt': 'apt',
+    'dpkg': 'apt',
+    'snap': 'snap',
+    'brew': 'brew',
+    'cask': 'brew',
+    'winget': 'winget',
+}
+
+BackendInfo = namedtuple('BackendInfo', ['name', 'available', 'version', 'path', 'checked'])
+
+def backends_for(cmd):
+    """Package managers a catalog command needs"""
+    return {COMMAND_BACKENDS[c.backend] for c in parse_command(cmd) if c.backend in COMMAND_BACKENDS}
+
+def probe(name):
+    """Check one package manager: look it up on PATH, then ask for its version"""
+    path = shutil.which(PROBES[name][0])
+    if path is None:
+        return BackendInfo(name, False, None, None, time.time())
+    try:
+        process = subprocess.run([path] + PROBES[name][1:], capture_output=True, text=True,
+                                 timeout=PROBE_TIMEOUT)
+    except (OSError, subprocess.SubprocessError):
+        return BackendInfo(name, False, None, path, time.time())
+    lines = process.stdout.strip().splitlines()
+    version = lines[0].strip() if lines else None
+    return BackendInfo(name, process.returncode == 0, version, path, time.time())
+
+class BackendDiscovery:
+    """Probes package managers concurrently in the background and memoizes them.
+
+    Results are kept for ttl seconds, in memory and in backends.json, so a
+    fresh launch usually needs no probe processes at all. A cached result is
+    dropped early if the executable's location on PATH has changed.
+    """
+
+    def __init__(self, names, path=BACKENDS_PATH, ttl=PROBE_TTL):
+        self.names = list(names)
+        self.path = path
+        self.ttl = ttl
+        self._lock = Lock()
+        self._futures = {}
+        # time.monotonic() (start, end) of probes run since take_timings()
+        self._timings = {}
+        self._cache = {}
+        try:
+            with open(path) as f:
+                self._cache = {name: BackendInfo(**info) for name, info in json.load(f).items()}
+        except (OSError, ValueError, TypeError):
+            self._cache = {}
+
+    def _is_fresh(self, info):
+        if info is None or time.time() - info.checked > self.ttl:
+            return False
+        return shutil.which(PROBES[info.name][0]) == info.path
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump({name: info._asdict() for name, info in self._cache.items()}, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def _probe(self, name):
+        start = time.monotonic()
+        info = probe(name)
+        with self._lock:
+            self._cache[name] = info
+            self._timings[name] = (start, time.monotonic())
+            self._save()
+        return info
+
+    def take_timings(self):
+        """{name: (start, end)} of the probes that ran since the last call, for tracing"""
+        with self._lock:
+            timings, self._timings = self._timings, {}
+        return timings
+
+    def start(self, on_done=None):
+        """Start probing anything not freshly cached; on_done(results) runs once all are known"""
+        stale = []
+        with self._lock:
+            for name in self.names:
+                future = self._futures.get(name)
+                if future is not None and (not future.done() or self._is_fresh(future.result())):
+                    # Probe still running, or its result is still valid
+                    continue
+                if self._is_fresh(self._cache.get(name)):
+                    future = Future()
+                    future.set_result(self._cache[name])
+                    self._futures[name] = future
+                else:
+                    stale.append(name)
+        if stale:
+            pool = ThreadPoolExecutor(max_workers=len(stale), thread_name_prefix='probe')
+            with self._lock:
+                for name in stale:
+                    self._futures[name] = pool.submit(self._probe, name)
+            pool.shutdown(wait=False)
+        if on_done:
+            pending = list(self._futures.values())
+            remaining = [len(pending)]
+            lock = Lock()
+
+            def finished(_):
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    on_done(self.results())
+            for future in pending:
+                future.add_done_callback(finished)
+        return self
+
+    def get(self, name):
+        """Probe result for one package manager, waiting if it is still running"""
+        with self._lock:
+            future = self._futures.get(name)
+        if future is None or (future.done() and not self._is_fresh(future.result())):
+            if name not in self.names:
+                self.names.append(name)
+            self.start()
+            future = self._futures[name]
+        return future.result()
+
+    def results(self):
+        return {name: self.get(name) for name in self.names}
+
+    def available(self, name):
+        return self.get(name).available
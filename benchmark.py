@@ -0,0 +1,262 @@
+"""Install benchmark for Zapinstall.
+
+Runs the headless installer (zapinstall.py install --json) against stub
+apt/snap/brew/winget executables with configurable latency, failure rate
+and lock behaviour, over several catalog sizes and --jobs levels, and
+prints the measurements as JSON:
+
+    python benchmark.py --sizes 10,100,1000 --jobs 1,4,8 --latency 0.05
+
+The stubs are Python scripts on PATH, so this needs a POSIX system.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from catalog import current_os
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STUB_NAMES = ['sudo', 'apt', 'apt-get', 'apt-cache', 'dpkg', 'dpkg-query', 'snap', 'brew', 'winget', 'wget']
+
+STUB = '''#!{python}
+import fcntl, os, random, sys, time
+
+name = os.path.basename(sys.argv[0])
+args = sys.argv[1:]
+with open(os.environ['ZAPBENCH_SPAWN_LOG'], 'a') as f:
+    f.write(name + '\\n')
+if name == 'sudo':
+    if args[:1] == ['-n']:
+        args = args[1:]
+    if args == ['-v']:
+        sys.exit(0)
+    os.execvp(args[0], args)
+if name == 'dpkg-query' or args[:1] == ['list']:
+    # Installed-package listings: nothing is installed
+    sys.exit(0)
+if name == 'apt-cache':
+    # Dependency closure: just the package itself
+    print(args[-1])
+    sys.exit(0)
+if args[:1] == ['download'] or (name == 'brew' and args[:1] in (['fetch'], ['--cache'], ['deps'])):
+    # Bundle staging: a small made-up artifact per package
+    cache = os.path.join(os.environ['ZAPBENCH_DIR'], 'brew-cache')
+    for package in [a for a in args[1:] if not a.startswith('-')]:
+        if name == 'apt-get':
+            artifacts = [package + '_1.0_all.deb']
+        elif name == 'snap':
+            artifacts = [package + '_1.snap', package + '_1.assert']
+        elif args[0] == 'fetch':
+            os.makedirs(cache, exist_ok=True)
+            artifacts = [os.path.join(cache, package + '.tar.gz')]
+        else:
+            artifacts = []
+            if args[0] == '--cache':
+                print(os.path.join(cache, package + '.tar.gz'))
+        for artifact in artifacts:
+            with open(artifact, 'w') as f:
+                f.write(f"{{name}} {{package}}\\n")
+    sys.exit(0)
+
+lock = {{'apt': 'dpkg', 'apt-get': 'dpkg', 'dpkg': 'dpkg', 'brew': 'brew', 'winget': 'winget'}}.get(name)
+if lock and os.environ.get('ZAPBENCH_LOCKS') == '1':
+    handle = open(os.path.join(os.environ['ZAPBENCH_DIR'], lock + '.lock'), 'w')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        with open(os.environ['ZAPBENCH_CONFLICT_LOG'], 'a') as f:
+            f.write(name + '\\n')
+        print(f"E: Could not get lock /var/lib/dpkg/lock-frontend ({{name}} is held by another process)", file=sys.stderr)
+        sys.exit(100)
+
+packages = [a for a in args[1:] if not a.startswith('-')]
+time.sleep(float(os.environ['ZAPBENCH_LATENCY']) + float(os.environ['ZAPBENCH_PER_PACKAGE']) * len(packages))
+rate = float(os.environ['ZAPBENCH_FAILURE_RATE'])
+for package in packages:
+    # Failures are deterministic per package so a retry fails the same way
+    if random.Random(os.environ['ZAPBENCH_SEED'] + package).random() < rate:
+        print(f"E: Unable to locate package {{package}}", file=sys.stderr)
+        sys.exit(100)
+    print(f"Setting up {{package}} ...")
+'''
+
+# Share of generated entries per install command shape, for each platform
+MIXES = {
+    'linux': [(0.5, 'sudo apt install bench-pkg-{i} -y'),
+              (0.3, 'sudo snap install bench-snap-{i}'),
+              (0.2, 'sudo snap install bench-classic-{i} --classic')],
+    'mac': [(0.5, 'brew install bench-formula-{i}'),
+            (0.5, 'brew install --cask bench-cask-{i}')],
+    'cmd': [(1.0, 'winget install Bench.Package{i}')],
+}
+
+def write_stubs(bin_dir):
+    os.makedirs(bin_dir, exist_ok=True)
+    script = STUB.format(python=sys.executable)
+    for name in STUB_NAMES:
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w') as f:
+            f.write(script)
+        os.chmod(path, 0o755)
+
+def write_catalog(path, size, os_type):
+    software = []
+    mix = MIXES[os_type]
+    for i in range(size):
+        # Deterministic spread over the mix: entry i gets the shape whose
+        # cumulative share first exceeds its position
+        position, total = (i + 0.5) / size, 0.0
+        for share, template in mix:
+            total += share
+            if position < total:
+                break
+        software.append({'name': f"Bench {i}", 'categories': ['Benchmark'], os_type: template.format(i=i)})
+    with open(path, 'w') as f:
+        json.dump({'categories': ['Benchmark'], 'software': software}, f)
+    return [entry['name'] for entry in software]
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000, 1)
+    return {'p50': pick(50), 'p90': pick(90), 'p99': pick(99), 'max': round(values[-1] * 1000, 1)}
+
+def read_lines(path):
+    try:
+        with open(path) as f:
+            return [line.strip() for line in f if line.strip()]
+    except OSError:
+        return []
+
+def run_trial(work_dir, size, jobs, args):
+    """Run one headless install and return its measurements"""
+    trial_dir = tempfile.mkdtemp(prefix=f"trial-{size}-{jobs}-", dir=work_dir)
+    bin_dir = os.path.join(work_dir, 'bin')
+    catalog_path = os.path.join(trial_dir, 'catalog.json')
+    names = write_catalog(catalog_path, size, args.os)
+    profile_path = os.path.join(trial_dir, 'profile.txt')
+    with open(profile_path, 'w') as f:
+        f.write('\n'.join(names) + '\n')
+
+    spawn_log = os.path.join(trial_dir, 'spawns.log')
+    conflict_log = os.path.join(trial_dir, 'conflicts.log')
+    env = dict(os.environ,
+               PATH=bin_dir + os.pathsep + os.environ.get('PATH', ''),
+               HOME=trial_dir,
+               ZAPINSTALL_CATALOG=catalog_path,
+               ZAPBENCH_DIR=trial_dir,
+               ZAPBENCH_SPAWN_LOG=spawn_log,
+               ZAPBENCH_CONFLICT_LOG=conflict_log,
+               ZAPBENCH_LATENCY=str(args.latency),
+               ZAPBENCH_PER_PACKAGE=str(args.per_package),
+               ZAPBENCH_FAILURE_RATE=str(args.failure_rate),
+               ZAPBENCH_LOCKS='1' if args.locks else '0',
+               ZAPBENCH_SEED=str(args.seed))
+    command = [sys.executable, os.path.join(ROOT, 'zapinstall.py'), 'install',
+               '--profile', profile_path, '--jobs', str(jobs), '--json']
+
+    start = time.monotonic()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    events = []
+    for line in process.stdout:
+        try:
+            events.append((time.monotonic() - start, json.loads(line)))
+        except ValueError:
+            pass
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.monotonic() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    job_durations = {}
+    queue_waits = []
+    ready_at = None
+    startup_ms = None
+    failed = 0
+    for at, event in events:
+        kind = event.get('event')
+        if kind == 'ready':
+            ready_at, startup_ms = at, event.get('startup_ms')
+        elif kind == 'started' and ready_at is not None:
+            queue_waits.append(at - ready_at)
+        elif kind == 'finished':
+            job_durations[event['job']] = event['duration']
+            failed += not event['ok']
+
+    spawns = Counter(read_lines(spawn_log))
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak_rss_kb = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return {
+        'size': size,
+        'jobs': jobs,
+        'exit_code': process.returncode,
+        'wall_s': round(wall, 3),
+        'startup_ms': startup_ms,
+        'job_latency_ms': percentiles(list(job_durations.values())),
+        'start_delay_ms': percentiles(queue_waits),
+        'spawns': dict(spawns),
+        'spawns_total': sum(spawns.values()),
+        'lock_conflicts': len(read_lines(conflict_log)),
+        'failed': failed,
+        'peak_rss_kb': peak_rss_kb,
+    }
+
+def compare(results, baseline_path, tolerance):
+    """Return the trials that got slower than the baseline by more than tolerance"""
+    with open(baseline_path) as f:
+        baseline = {(r['size'], r['jobs']): r for r in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        old = baseline.get((result['size'], result['jobs']))
+        if old and result['wall_s'] > old['wall_s'] * (1 + tolerance):
+            regressions.append({'size': result['size'], 'jobs': result['jobs'],
+                                'wall_s': result['wall_s'], 'baseline_wall_s': old['wall_s']})
+    return regressions
+
+def int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Zapinstall against stub package managers")
+    parser.add_argument('--sizes', type=int_list, default=[10, 100, 1000], help="catalog sizes (default 10,100,1000)")
+    parser.add_argument('--jobs', type=int_list, default=[1, 4, 8], help="--jobs levels (default 1,4,8)")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per stub invocation")
+    parser.add_argument('--per-package', type=float, default=0.005, help="extra seconds per package in a call")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="share of packages that fail to install")
+    parser.add_argument('--no-locks', dest='locks', action='store_false',
+                        help="do not simulate apt/brew/winget lock contention")
+    parser.add_argument('--os', choices=sorted(MIXES), default=current_os(), help="platform mix to generate")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="also write the JSON report to this file")
+    parser.add_argument('--baseline', help="earlier report to compare wall times against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown vs. baseline (default 0.2)")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='zapbench-')
+    try:
+        write_stubs(os.path.join(work_dir, 'bin'))
+        results = [run_trial(work_dir, size, jobs, args) for size in args.sizes for jobs in args.jobs]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {'config': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+              'results': results}
+    if args.baseline:
+        report['regressions'] = compare(results, args.baseline, args.tolerance)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    return 1 if report.get('regressions') else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from urllib.parse import urlsplit
+
+from catalog import find_command, get_catalog
+from engine import DEFAULT_JOBS
+from failures import last_line
+from planner import format_command, parse_command
+
+MANIFEST_NAME = 'manifest.json'
+CHECKSUMS_NAME = 'SHA256SUMS'
+BUNDLE_FORMAT = 1
+HASH_CHUNK = 1 << 20
+# Seconds one package-manager download may take
+STAGE_TIMEOUT = 30 * 60
+
+# The package and everything it depends on, one name per unindented line
+APT_DEPENDS = ['apt-cache', 'depends', '--recurse', '--no-recommends', '--no-suggests', '--no-conflicts',
+               '--no-breaks', '--no-replaces', '--no-enhances']
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def mirror_source(url, mirror):
+    """Where to fetch url from a mirror: mirror's base URL or directory plus url's path"""
+    path = urlsplit(url).path
+    if urlsplit(mirror).scheme in ('http', 'https'):
+        return mirror.rstrip('/') + path
+    return os.path.join(mirror, *path.lstrip('/').split('/'))
+
+def _run(args, cwd=None):
+    """stdout of a staging command; raises RuntimeError if it fails"""
+    try:
+        process = subprocess.run(args, cwd=cwd, capture_output=True, text=True, errors='replace',
+                                 timeout=STAGE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise RuntimeError(f"{args[0]}: {e}")
+    if process.returncode != 0:
+        raise RuntimeError(last_line(process.stderr) or f"{' '.join(args[:2])} exited with {process.returncode}")
+    return process.stdout
+
+def _find(directory, prefix, suffix):
+    """Newest file in directory named prefix*suffix, or None"""
+    matches = [os.path.join(directory, f) for f in os.listdir(directory) if f.startswith(prefix) and f.endswith(suffix)]
+    return max(matches, key=os.path.getmtime, default=None)
+
+class Bundler:
+    """Downloads what catalog entries install into a bundle directory.
+
+    Each step of an entry's command is staged the way its backend can
+    install offline: apt packages as the .debs of the package and its
+    dependencies (apt-get download), snaps as the .snap plus its .assert
+    (snap download), Homebrew formulae and casks as the files brew fetch
+    leaves in its cache, and direct downloads through the DownloadCache,
+    or from mirror (a base URL or a directory) if one is given. winget and
+    plain shell steps cannot be staged; those entries are listed as
+    unsupported in the manifest. Package managers stage on the machine
+    running the bundle, so apt, snap and brew steps need the target OS.
+
+    The bundle holds files/<backend>/..., manifest.json (entries, the
+    steps to install each one and every file's size and SHA-256) and a
+    SHA256SUMS file that sha256sum -c can check.
+    """
+
+    def __init__(self, root, os_type, mirror=None, max_workers=DEFAULT_JOBS, cache=None):
+        self.root = os.path.abspath(root)
+        self.os_type = os_type
+        self.mirror = mirror
+        self.max_workers = max_workers
+        self._cache = cache
+        # Entries are staged in parallel, but one download per backend at a
+        # time since they share a directory (and apt-get already fetches in parallel)
+        self._locks = {backend: Lock() for backend in ('apt', 'snap', 'brew')}
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            from downloads import DownloadCache
+            self._cache = DownloadCache(max_workers=self.max_workers)
+        return self._cache
+
+    def _dir(self, backend):
+        path = os.path.join(self.root, 'files', backend)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _file(self, path, package):
+        return {'path': os.path.relpath(path, self.root).replace(os.sep, '/'), 'package': package}
+
+    def _stage_apt(self, command):
+        directory = self._dir('apt')
+        names = [line.strip() for line in _run(APT_DEPENDS + [command.package]).splitlines()
+                 if line.strip() and not line[0].isspace() and not line.startswith('<')]
+        names = list(dict.fromkeys(names)) or [command.package]
+        files = []
+        with self._locks['apt']:
+            # Dependencies shared with entries staged earlier are only fetched once
+            wanted = [name for name in names if not _find(directory, name.split(':')[0] + '_', '.deb')]
+            if wanted:
+                _run(['apt-get', 'download'] + wanted, cwd=directory)
+            for name in names:
+                path = _find(directory, name.split(':')[0] + '_', '.deb')
+                if path is None:
+                    raise RuntimeError(f"apt-get download did not produce a .deb for {name}")
+                files.append(self._file(path, name))
+        return files
+
+    def _stage_snap(self, command):
+        directory = self._dir('snap')
+        channel = [flag for flag in command.flags if flag.startswith('--channel=')]
+        with self._locks['snap']:
+            _run(['snap', 'download'] + channel + [command.package], cwd=directory)
+            path = _find(directory, command.package + '_', '.snap')
+        if path is None:
+            raise RuntimeError(f"snap download did not produce a .snap for {command.package}")
+        assertion = path[:-len('.snap')] + '.assert'
+        return [self._file(assertion, command.package), self._file(path, command.package)]
+
+    def _stage_brew(self, command):
+        cask = ['--cask'] if command.backend == 'cask' else []
+        names = [command.package]
+        if not cask:
+            names += _run(['brew', 'deps', command.package]).split()
+        directory = self._dir(command.backend)
+        files = []
+        with self._locks['brew']:
+            for name in names:
+                _run(['brew', 'fetch'] + cask + [name])
+                cached = _run(['brew', '--cache'] + cask + [name]).strip()
+                path = os.path.join(directory, os.path.basename(cached))
+                shutil.copyfile(cached, path)
+                files.append(self._file(path, name))
+        return files
+
+    def _stage_url(self, command):
+        url = command.package
+        path = os.path.join(self._dir('downloads'), os.path.basename(urlsplit(url).path) or 'download')
+        source = mirror_source(url, self.mirror) if self.mirror else url
+        if urlsplit(source).scheme in ('http', 'https'):
+            source = self.cache.fetch(source)
+        shutil.copyfile(source, path)
+        return [self._file(path, url)]
+
+    def stage(self, name, cmd):
+        """Manifest record for one catalog entry; raises RuntimeError if it cannot be staged"""
+        stagers = {'apt': self._stage_apt, 'snap': self._stage_snap, 'brew': self._stage_brew,
+                   'cask': self._stage_brew, 'wget': self._stage_url}
+        steps = []
+        downloaded = set()
+        for command in parse_command(cmd):
+            if command.backend == 'dpkg' and command.package in downloaded:
+                files = []
+            elif command.backend in stagers:
+                files = stagers[command.backend](command)
+            else:
+                raise RuntimeError(f"{command.backend} steps cannot be staged for offline installs")
+            if command.backend == 'wget':
+                downloaded.add(os.path.basename(urlsplit(command.package).path))
+            steps.append({'backend': command.backend, 'package': command.package, 'flags': list(command.flags),
+                          'files': files})
+        return {'name': name, 'command': cmd, 'steps': steps}
+
+    def create(self, names, on_entry=None):
+        """Stage names and their prerequisites, then write the manifest and checksums.
+
+        on_entry(name, error) is called as each entry finishes staging, with
+        error None if it was staged. Returns the manifest dict.
+        """
+        resolved = get_catalog().resolve(names)
+        os.makedirs(self.root, exist_ok=True)
+
+        def stage(name):
+            cmd = find_command(name, self.os_type)
+            try:
+                if not cmd:
+                    raise RuntimeError(f"no command for {self.os_type}")
+                record, error = self.stage(name, cmd), None
+            except (RuntimeError, OSError, ValueError) as e:
+                record, error = None, str(e)
+            except Exception as e:
+                # requests errors from direct downloads
+                record, error = None, f"download failed: {e}"
+            if on_entry:
+                on_entry(name, error)
+            return name, record, error
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='bundle') as pool:
+            results = list(pool.map(stage, resolved))
+            entries = [record for _, record, _ in results if record]
+            paths = sorted({f['path'] for record in entries for step in record['steps'] for f in step['files']})
+            # Hashing releases the GIL, so large files are checksummed in parallel
+            digests = pool.map(lambda rel: sha256_file(os.path.join(self.root, rel)), paths)
+            files = {rel: {'sha256': digest, 'size': os.path.getsize(os.path.join(self.root, rel))}
+                     for rel, digest in zip(paths, digests)}
+        if self._cache is not None:
+            self._cache.close()
+
+        manifest = {'format': BUNDLE_FORMAT, 'os': self.os_type, 'created': time.time(),
+                    'packages': [record['name'] for record in entries], 'entries': entries,
+                    'unsupported': {name: error for name, _, error in results if error}, 'files': files}
+        _write_atomic(os.path.join(self.root, MANIFEST_NAME), json.dumps(manifest, indent=1) + '\n')
+        _write_atomic(os.path.join(self.root, CHECKSUMS_NAME),
+                      ''.join(f"{files[rel]['sha256']}  {rel}\n" for rel in paths))
+        return manifest
+
+def _write_atomic(path, text):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+class Bundle:
+    """A bundle directory written by Bundler, installed from without the network"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        try:
+            with open(os.path.join(self.root, MANIFEST_NAME), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except ValueError:
+            raise ValueError(f"{root} has a damaged {MANIFEST_NAME}")
+        if manifest.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f"{root} is not a Zapinstall bundle (or needs a newer version)")
+        self.os = manifest['os']
+        self.packages = manifest['packages']
+        self.entries = {record['name']: record for record in manifest['entries']}
+        self.unsupported = manifest['unsupported']
+        self.files = manifest['files']
+
+    def path(self, rel):
+        path = os.path.normpath(os.path.join(self.root, *rel.split('/')))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"bundle file outside the bundle: {rel}")
+        return path
+
+    def files_of(self, name):
+        """Relative paths of the files entry name installs from"""
+        return [f['path'] for step in self.entries[name]['steps'] for f in step['files']]
+
+    def verify(self, names=None, max_workers=DEFAULT_JOBS):
+        """Check the files of entries names (default all) against the manifest, several at a time.
+
+        Returns {relative path: problem} for files that are missing, have
+        the wrong size or the wrong SHA-256; empty if all of them are fine.
+        """
+        names = self.entries if names is None else names
+        paths = sorted({rel for name in names for rel in self.files_of(name)})
+
+        def check(rel):
+            expected = self.files.get(rel)
+            if expected is None:
+                return "not in the manifest"
+            try:
+                path = self.path(rel)
+                if os.path.getsize(path) != expected['size']:
+                    return "size mismatch"
+                if sha256_file(path) != expected['sha256']:
+                    return "checksum mismatch"
+            except OSError as e:
+                return f"unreadable ({e.strerror})"
+            except ValueError as e:
+                return str(e)
+            return None
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='verify') as pool:
+            problems = dict(zip(paths, pool.map(check, paths)))
+        return {rel: problem for rel, problem in problems.items() if problem}
+
+    def command(self, name, installed=()):
+        """Shell command installing entry name from the bundle's files only, or None if it is not bundled.
+
+        installed holds the names of the apt packages already on this
+        machine; their bundled .debs are left out so apt does not try to
+        downgrade them.
+        """
+        record = self.entries.get(name)
+        if record is None:
+            return None
+        steps = []
+        local = {}
+        for step in record['steps']:
+            backend, package, flags = step['backend'], step['package'], tuple(step['flags'])
+            files = [(self.path(f['path']), f['package']) for f in step['files']]
+            if backend == 'apt':
+                # Install the staged .debs by path, so apt needs neither the
+                # network nor package lists that know these versions
+                debs = [path for path, deb in files if deb == package or deb.split(':')[0] not in installed]
+                steps.append(format_command('apt', debs, flags + ('--no-download',)))
+            elif backend == 'snap':
+                assertion, snap = files[0][0], files[1][0]
+                flags = tuple(flag for flag in flags if not flag.startswith('--channel='))
+                steps.append(f"sudo snap ack {shlex.quote(assertion)} && {format_command('snap', [snap], flags)}")
+            elif backend in ('brew', 'cask'):
+                # brew installs from its cache without downloading when the file is already there
+                cask = ' --cask' if backend == 'cask' else ''
+                for path, cached in files:
+                    steps.append(f'cp {shlex.quote(path)} "$(brew --cache{cask} {shlex.quote(cached)})"')
+                steps.append('HOMEBREW_NO_AUTO_UPDATE=1 ' + format_command(backend, [package], flags))
+            elif backend == 'wget':
+                local[os.path.basename(urlsplit(package).path)] = files[0][0]
+            elif backend == 'dpkg':
+                steps.append(format_command('dpkg', [local[package]], flags))
+        return ' && '.join(steps)
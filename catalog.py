@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.json')
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'zapinstall')
+
+# Bump whenever compile_catalog or Catalog changes, so snapshots pickled by
+# older code are not loaded
+CACHE_FORMAT = 2
+# Compiled snapshots kept (e.g. for the bundled and a $ZAPINSTALL_CATALOG file)
+CACHE_KEEP = 4
+
+# Per-OS command keys: 'cmd' (Windows/winget), 'linux' (apt/snap) and 'mac' (brew)
+OS_KEYS = ('cmd', 'linux', 'mac')
+
+def current_os():
+    """Return the catalog key for the running platform"""
+    return 'cmd' if sys.platform == 'win32' else 'linux' if sys.platform.startswith('linux') else 'mac'
+
+class Catalog:
+    """Compiled software catalog: a flat name -> entry index plus category membership.
+
+    Each entry is a dict with 'name', 'categories', one install command
+    per OS key, optional 'requires' / 'conflicts' lists of entry names and
+    an optional approximate install size in 'size_mb'.
+    """
+
+    def __init__(self, entries, categories):
+        self.entries = entries
+        self.categories = categories
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def command(self, name, os_type=None):
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        return entry.get(os_type or current_os())
+
+    def requires(self, name):
+        return self.entries[name].get('requires', [])
+
+    def size(self, name):
+        """Approximate disk space an entry needs once installed, in bytes (0 if unknown)"""
+        return int(self.entries[name].get('size_mb', 0) * 1024 * 1024)
+
+    def dependency_order(self, names):
+        """Expand names with their prerequisites, each after what it requires.
+
+        Raises ValueError if the requirements form a cycle.
+        """
+        order = []
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                cycle = path[path.index(name):] + [name]
+                raise ValueError(f"Dependency cycle: {' -> '.join(cycle)}")
+            state[name] = 'visiting'
+            for required in self.requires(name):
+                visit(required, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for name in names:
+            visit(name, [])
+        return order
+
+    def resolve(self, names):
+        """Dependency-ordered selection; also rejects conflicting entries"""
+        order = self.dependency_order(names)
+        chosen = set(order)
+        for name in order:
+            for other in self.entries[name].get('conflicts', []):
+                if other in chosen:
+                    raise ValueError(f"{name} conflicts with {other}")
+        return order
+
+def compile_catalog(data):
+    """Build a Catalog from the parsed JSON source, rejecting duplicate names"""
+    categories = {category: [] for category in data.get('categories', [])}
+    entries = {}
+    for entry in data['software']:
+        name = entry['name']
+        if name in entries:
+            raise ValueError(f"Duplicate catalog entry: {name}")
+        if not any(key in entry for key in OS_KEYS):
+            raise ValueError(f"Catalog entry {name} has no install commands")
+        entry = dict(entry, categories=list(entry.get('categories', [])))
+        entries[name] = entry
+        for category in entry['categories']:
+            categories.setdefault(category, []).append(name)
+    for name, entry in entries.items():
+        for field in ('requires', 'conflicts'):
+            for other in entry.get(field, []):
+                if other not in entries:
+                    raise ValueError(f"Catalog entry {name} {field} unknown entry {other}")
+    catalog = Catalog(entries, categories)
+    catalog.dependency_order(entries)
+    return catalog
+
+def _cache_path(digest):
+    return os.path.join(CACHE_DIR, f"catalog-v{CACHE_FORMAT}-{digest[:16]}.pickle")
+
+def _prune_cache():
+    """Remove snapshots of other formats and all but the CACHE_KEEP newest of this one"""
+    prefix = f"catalog-v{CACHE_FORMAT}-"
+    try:
+        names = [n for n in os.listdir(CACHE_DIR) if n.startswith('catalog-') and n.endswith('.pickle')]
+    except OSError:
+        return
+    current = [os.path.join(CACHE_DIR, n) for n in names if n.startswith(prefix)]
+    stale = [os.path.join(CACHE_DIR, n) for n in names if not n.startswith(prefix)]
+    try:
+        current.sort(key=os.path.getmtime, reverse=True)
+    except OSError:
+        return
+    for path in stale + current[CACHE_KEEP:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def load_catalog(path=CATALOG_PATH, use_cache=True):
+    """Load a catalog file, reusing the compiled snapshot keyed by its hash"""
+    with open(path, 'rb') as f:
+        source = f.read()
+    digest = hashlib.sha256(source).hexdigest()
+    cache_path = _cache_path(digest)
+    if use_cache:
+        try:
+            with open(cache_path, 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            pass
+
+    catalog = compile_catalog(json.loads(source))
+    if use_cache:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                pickle.dump(catalog, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache_path)
+        except OSError:
+            pass
+        _prune_cache()
+    return catalog
+
+_catalog = None
+
+def get_catalog():
+    """The catalog named by $ZAPINSTALL_CATALOG, or the bundled one"""
+    global _catalog
+    if _catalog is None:
+        _catalog = load_catalog(os.environ.get('ZAPINSTALL_CATALOG') or CATALOG_PATH)
+    return _catalog
+
+def find_command(software, os_type=None):
+    return get_catalog().command(software, os_type)
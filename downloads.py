@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Event, Lock
+from urllib.parse import urlsplit
+
+from catalog import CACHE_DIR
+from engine import DEFAULT_JOBS
+
+DOWNLOAD_DIR = os.path.join(CACHE_DIR, 'downloads')
+CHUNK_SIZE = 1 << 20
+TIMEOUT = 30
+
+def make_session(pool_size=DEFAULT_JOBS):
+    """A requests.Session whose connection pool fits pool_size parallel fetches"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def _url_key(url):
+    return hashlib.sha256(url.encode()).hexdigest()
+
+def _filename(url):
+    return os.path.basename(urlsplit(url).path) or 'download'
+
+class DownloadCache:
+    """Content-addressed cache for direct-download installers.
+
+    Finished files live at blobs/<sha256>/<original name> and index.json
+    maps each URL to its blob plus the ETag/Last-Modified validators used
+    to revalidate it. Interrupted transfers stay in partial/ and resume
+    with an HTTP Range request on the next fetch.
+    """
+
+    def __init__(self, root=DOWNLOAD_DIR, session=None, max_workers=DEFAULT_JOBS):
+        self.root = root
+        self.max_workers = max_workers
+        self._session = session
+        self._lock = Lock()
+        self._inflight = {}
+        self._pool = None
+        self._cancelled = Event()
+        self.index_path = os.path.join(root, 'index.json')
+        try:
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = make_session(self.max_workers)
+        return self._session
+
+    def _save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp, self.index_path)
+
+    def cached_path(self, url):
+        """Path of the cached copy of url, without touching the network"""
+        entry = self.index.get(url)
+        if not entry:
+            return None
+        path = os.path.join(self.root, 'blobs', entry['sha256'], entry['filename'])
+        return path if os.path.exists(path) else None
+
+    def fetch(self, url):
+        """Return a local path for url, downloading or revalidating as needed"""
+        with self._lock:
+            future = self._inflight.get(url)
+            owner = future is None
+            if owner:
+                future = self._inflight[url] = Future()
+        if not owner:
+            return future.result()
+        try:
+            path = self._fetch(url)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(url, None)
+
+    def prefetch(self, urls):
+        """Start fetching urls in the background; returns {url: Future}"""
+        with self._lock:
+            if self._cancelled.is_set():
+                return {}
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='download')
+        return {url: self._pool.submit(self.fetch, url) for url in dict.fromkeys(urls)}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+    def cancel(self):
+        """Stop every fetch, running or queued; safe to call from any thread.
+
+        Transfers stop at the next chunk and keep their partial file, so a
+        later fetch resumes them.
+        """
+        self._cancelled.set()
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise RuntimeError("Download cancelled")
+
+    def _fetch(self, url):
+        import requests
+
+        self._check_cancelled()
+        cached = self.cached_path(url)
+        headers = {}
+        if cached:
+            entry = self.index[url]
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        partial_dir = os.path.join(self.root, 'partial')
+        os.makedirs(partial_dir, exist_ok=True)
+        partial = os.path.join(partial_dir, _url_key(url))
+        meta_path = partial + '.json'
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        meta = {}
+        if offset:
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                offset = 0
+        validator = meta.get('etag') or meta.get('last_modified')
+        if offset and validator:
+            headers['Range'] = f"bytes={offset}-"
+            headers['If-Range'] = validator
+        else:
+            offset = 0
+
+        try:
+            response = self.session.get(url, headers=headers, stream=True, timeout=TIMEOUT)
+        except requests.RequestException:
+            if cached:
+                # Offline: an old copy beats no copy
+                return cached
+            raise
+        with response:
+            if response.status_code == 304 and cached:
+                return cached
+            if response.status_code == 416:
+                # Our partial file no longer matches the remote; start over
+                os.remove(partial)
+                return self._fetch(url)
+            response.raise_for_status()
+
+            digest = hashlib.sha256()
+            if response.status_code == 206:
+                with open(partial, 'rb') as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                mode = 'ab'
+            else:
+                mode = 'wb'
+                meta = {'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified')}
+                with open(meta_path, 'w') as f:
+                    json.dump(meta, f)
+
+            with open(partial, mode) as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    self._check_cancelled()
+                    f.write(chunk)
+                    digest.update(chunk)
+
+        sha256 = digest.hexdigest()
+        filename = _filename(url)
+        blob_dir = os.path.join(self.root, 'blobs', sha256)
+        os.makedirs(blob_dir, exist_ok=True)
+        path = os.path.join(blob_dir, filename)
+        os.replace(partial, path)
+        try:
+            os.remove(meta_path)
+        except OSError:
+            pass
+        with self._lock:
+            self.index[url] = {'sha256': sha256, 'filename': filename, 'size': os.path.getsize(path),
+                               'etag': meta.get('etag'), 'last_modified': meta.get('last_modified')}
+            self._save_index()
+        return path
@@ -0,0 +1,491 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from failures import classify
+
+DEFAULT_JOBS = 4
+MAX_JOBS = 16
+# Lines of stdout/stderr kept per job for error reports
+OUTPUT_TAIL = 200
+# Seconds between checks while a throttle holds every job back
+THROTTLE_POLL = 1.0
+# Seconds a cancelled job's processes get to exit after SIGTERM before SIGKILL
+CANCEL_GRACE = 5.0
+# Longest output line read whole; longer ones are dropped
+LINE_LIMIT = 1 << 20
+
+# Package managers that hold a system-wide lock while they run. Jobs in the
+# same lane go through one at a time; jobs without a lane (snap, casks,
+# plain downloads) run alongside everything else.
+LOCKED_BACKENDS = {
+    'apt': 'dpkg',
+    'apt-get': 'dpkg',
+    'dpkg': 'dpkg',
+    'brew': 'brew',
+    'winget': 'winget',
+}
+
+def lane_for(cmd):
+    """Return the lock lane a command string runs in, or None"""
+    words = cmd.replace('&&', ' ').split()
+    if 'brew' in words and '--cask' in words:
+        return None
+    for word in words:
+        if word in LOCKED_BACKENDS:
+            return LOCKED_BACKENDS[word]
+    return None
+
+class Job:
+    def __init__(self, name, cmd, lane=None, packages=None, fallback=None, requires=(), provides=None):
+        self.name = name
+        self.cmd = cmd
+        self.lane = lane
+        # Catalog entries this job installs, and the single-package jobs to
+        # run instead if a merged batch fails
+        self.packages = list(packages) if packages is not None else [name]
+        self.fallback = fallback or []
+        # Dependency keys (catalog names, or e.g. 'download:<url>') this job
+        # needs finished first, and the keys it satisfies when it succeeds
+        self.requires = set(requires)
+        self.provides = set(provides) if provides is not None else set(self.packages)
+        # Approximate bytes of disk the job will use, if known
+        self.size = 0
+        # Optional callable run on the worker just before the job starts;
+        # it returns the command to run (e.g. after a download finishes)
+        self.prepare = None
+        # Optional callable run instead of a shell command
+        self.action = None
+        # time.monotonic() when the job entered the scheduler's queue
+        self.queued_at = None
+        # Retries so far, and time.monotonic() before which it must not start
+        self.attempts = 0
+        self.not_before = 0.0
+
+    def __repr__(self):
+        return f"Job({self.name!r}, lane={self.lane!r})"
+
+class JobResult:
+    def __init__(self, job, returncode, stdout="", stderr="", duration=0.0, started=None):
+        self.job = job
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+        self.started = time.monotonic() - duration if started is None else started
+        # Set when the job was stopped (or never started) because the run was cancelled
+        self.cancelled = False
+
+    @property
+    def wait(self):
+        """Seconds the job spent queued before it started"""
+        if self.job.queued_at is None:
+            return 0.0
+        return max(0.0, self.started - self.job.queued_at)
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    @property
+    def failure(self):
+        """Failure class (see failures.classify, or 'cancelled'), or None if the job succeeded"""
+        if self.ok:
+            return None
+        if self.cancelled:
+            return 'cancelled'
+        return classify(self.returncode, self.stderr, self.stdout)
+
+# Jobs are not in the terminal's foreground process group, so a sudo that
+# prompts for a password would be stopped (SIGTTIN) and hang its lane; with
+# -n it fails at once and is reported as a permission problem
+NONINTERACTIVE_SUDO = 'sudo() { command sudo -n "$@"; }; '
+
+def shell_argv(cmd):
+    """argv that runs a catalog command string through the platform shell"""
+    if sys.platform == 'win32':
+        return [os.environ.get('COMSPEC', 'cmd.exe'), '/d', '/s', '/c', cmd]
+    return ['/bin/sh', '-c', NONINTERACTIVE_SUDO + cmd]
+
+# Each job gets its own process group so cancelling can stop everything it
+# started. On POSIX it stays in our session, so sudo still finds the
+# credentials cached for this terminal. preexec_fn is not safe with threads
+# running, so it is only the fallback for Pythons before 3.11.
+if sys.platform == 'win32':
+    PROCESS_GROUP = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+elif sys.version_info >= (3, 11):
+    PROCESS_GROUP = {'process_group': 0}
+else:
+    PROCESS_GROUP = {'preexec_fn': os.setpgrp}
+
+def _signal_group(pgid, sig):
+    """Send sig to a process group; False once the group is gone"""
+    try:
+        os.killpg(pgid, sig)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Only root-owned members (under sudo) are left
+        pass
+    return True
+
+async def terminate_group(process, grace=CANCEL_GRACE):
+    """Stop a job's process tree: the shell, sudo, the package manager and its helpers.
+
+    On POSIX the group gets SIGTERM, which sudo passes on to the command it
+    runs as root, and SIGKILL if anything is left after grace seconds. On
+    Windows, taskkill /T ends the whole tree.
+    """
+    if sys.platform == 'win32':
+        killer = await asyncio.create_subprocess_exec('taskkill', '/T', '/F', '/PID', str(process.pid),
+                                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        await killer.wait()
+        return
+    deadline = time.monotonic() + grace
+    if not _signal_group(process.pid, signal.SIGTERM):
+        return
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+        if not _signal_group(process.pid, 0):
+            return
+    _signal_group(process.pid, signal.SIGKILL)
+
+async def run_command(job, on_output=None, on_spawn=None, executor=None):
+    """Run a job's shell command, passing each output line to on_output as it arrives.
+
+    The command runs in its own process group, passed to on_spawn(job,
+    process) once it exists so it can be cancelled. stdout and stderr are
+    read concurrently so neither pipe can fill up and stall the process;
+    only the last OUTPUT_TAIL lines of each are kept for the result.
+    Blocking prepare and action callables run on executor (default: the
+    loop's).
+    """
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+    if job.action is not None:
+        try:
+            await loop.run_in_executor(executor, job.action)
+            return JobResult(job, 0, duration=time.monotonic() - start, started=start)
+        except Exception as e:
+            return JobResult(job, -1, stderr=str(e), duration=time.monotonic() - start, started=start)
+    try:
+        cmd = await loop.run_in_executor(executor, job.prepare) if job.prepare else job.cmd
+        process = await asyncio.create_subprocess_exec(*shell_argv(cmd), stdin=subprocess.DEVNULL,
+                                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                                       limit=LINE_LIMIT, **PROCESS_GROUP)
+    except Exception as e:
+        return JobResult(job, -1, stderr=str(e), duration=time.monotonic() - start, started=start)
+    if on_spawn:
+        on_spawn(job, process)
+
+    tails = {'stdout': deque(maxlen=OUTPUT_TAIL), 'stderr': deque(maxlen=OUTPUT_TAIL)}
+
+    async def pump(stream, name):
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                continue
+            if not line:
+                break
+            line = line.decode(errors='replace').rstrip('\r\n')
+            tails[name].append(line)
+            if on_output:
+                on_output(job, name, line)
+
+    try:
+        await asyncio.gather(pump(process.stdout, 'stdout'), pump(process.stderr, 'stderr'))
+        returncode = await process.wait()
+    except asyncio.CancelledError:
+        # The loop is going away (e.g. Ctrl-C): do not leave the package manager running
+        await terminate_group(process)
+        raise
+    return JobResult(job, returncode, '\n'.join(tails['stdout']), '\n'.join(tails['stderr']),
+                     time.monotonic() - start, started=start)
+
+class Scheduler:
+    """Runs up to max_workers jobs at once on an asyncio event loop, one at a time per lane.
+
+    Callbacks are called on the loop's thread; only wake() and cancel()
+    may be called from other threads.
+    """
+
+    def __init__(self, max_workers=DEFAULT_JOBS, on_start=None, on_result=None, on_split=None,
+                 on_output=None, runner=run_command, throttle=None, retry=None, on_retry=None,
+                 on_cancel=None):
+        self.max_workers = max(1, min(int(max_workers), MAX_JOBS))
+        self.on_start = on_start
+        self.on_result = on_result
+        self.on_split = on_split
+        self.on_output = on_output
+        self.runner = runner
+        # Optional: throttle.workers(max_workers) is how many jobs may run
+        # now, throttle.admits(job, reserved) whether job fits (e.g. on disk)
+        # next to running jobs needing reserved bytes. Jobs held back with
+        # nothing running for throttle.max_wait seconds fail.
+        self.throttle = throttle
+        # Optional: retry.delay(result) is the seconds to wait before a
+        # failed job runs again, or None to give up
+        self.retry = retry
+        self.on_retry = on_retry
+        self.on_cancel = on_cancel
+        self.cancelled = False
+        self._loop = None
+        self._wakeup = None
+        self._stopped = False
+        self._reserved = 0
+        self._throttled = False
+        self._busy_lanes = set()
+        self._running = 0
+        self._finished = []
+        self._planned = set()
+        self._provided = set()
+        self._failed = set()
+        # Live processes by job, the tasks running jobs by job, and every
+        # task running or terminating a job
+        self._processes = {}
+        self._workers = {}
+        self._tasks = set()
+        # Runs prepare and action callables; not the loop's default executor,
+        # which asyncio.run waits for even after the run was cancelled
+        self._executor = None
+
+    def _next_job(self, pending):
+        # A job needs a slot, its lane, and every requires key provided by a
+        # finished job; keys no job in the run provides count as satisfied
+        self._throttled = False
+        if self.cancelled or self._running >= self.max_workers:
+            return None
+        if self.throttle is not None and self._running >= self.throttle.workers(self.max_workers):
+            self._throttled = True
+            return None
+        now = time.monotonic()
+        for job in pending:
+            if job.not_before > now:
+                continue
+            if job.lane is not None and job.lane in self._busy_lanes:
+                continue
+            if (job.requires & self._planned) - self._provided:
+                continue
+            if self.throttle is not None and not self.throttle.admits(job, self._reserved):
+                self._throttled = True
+                continue
+            return job
+        return None
+
+    def _retry_at(self, pending):
+        """Earliest time a job waiting out a retry delay may start, or None"""
+        now = time.monotonic()
+        return min((job.not_before for job in pending if job.not_before > now), default=None)
+
+    def _notify(self):
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # The run already finished and its loop is closed
+            pass
+
+    def wake(self):
+        """Re-check held-back jobs, e.g. after the throttle's limits changed"""
+        self._notify()
+
+    def cancel(self):
+        """Cancel the run: nothing new starts and running jobs are terminated.
+
+        Jobs still in a prepare or action callable are abandoned and
+        on_cancel() is called so the callable can be told to stop. The run
+        is cancelled the same way if the task running it is (e.g. Ctrl-C).
+        """
+        self.cancelled = True
+        self._notify()
+
+    async def _sleep(self, timeout):
+        """Wait until something changed (a job finished, wake(), cancel()) or timeout passed"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _spawned(self, job, process):
+        self._processes[job] = process
+        if self._stopped:
+            self._spawn(terminate_group(process))
+
+    async def _worker(self, job):
+        start = time.monotonic()
+        try:
+            self._workers[job] = asyncio.current_task()
+            result = await self.runner(job, self.on_output, self._spawned, executor=self._executor)
+            result.cancelled = self.cancelled and not result.ok
+        except BaseException:
+            result = JobResult(job, -1, stderr="Cancelled", duration=time.monotonic() - start, started=start)
+            result.cancelled = True
+            raise
+        finally:
+            self._processes.pop(job, None)
+            self._workers.pop(job, None)
+            self._finished.append(result)
+            self._running -= 1
+            self._reserved -= job.size
+            self._busy_lanes.discard(job.lane)
+            self._wakeup.set()
+
+    def _stop(self, pending, results):
+        """Act on cancel(): fail the jobs still waiting and terminate the running ones"""
+        self._stopped = True
+        now = time.monotonic()
+        while pending:
+            result = JobResult(pending.pop(0), -1, stderr="Cancelled before it started", started=now)
+            result.cancelled = True
+            self._complete(result, pending, results)
+        for process in self._processes.values():
+            self._spawn(terminate_group(process))
+        for job, task in list(self._workers.items()):
+            if job not in self._processes:
+                # Blocked in a prepare or action callable: stop waiting for it
+                task.cancel()
+        if self.on_cancel:
+            self.on_cancel()
+
+    def _complete(self, result, pending, results):
+        job = result.job
+        if not result.ok and self.retry is not None and not self.cancelled:
+            # Back in the queue, its lane free while it waits; a failed batch
+            # is retried whole before it is split into single packages
+            delay = self.retry.delay(result)
+            if delay is not None:
+                job.attempts += 1
+                job.not_before = time.monotonic() + delay
+                pending.insert(0, job)
+                if self.on_retry:
+                    self.on_retry(result, delay)
+                return
+        if not result.ok and job.fallback and not self.cancelled:
+            # Retry a failed batch one package at a time, ahead of
+            # anything else still waiting
+            now = time.monotonic()
+            for fallback in job.fallback:
+                fallback.queued_at = now
+            pending[:0] = job.fallback
+            if self.on_split:
+                self.on_split(result)
+            return
+        if result.ok:
+            self._provided |= job.provides
+        else:
+            self._failed |= job.provides
+        results.append(result)
+        if self.on_result:
+            self.on_result(result)
+
+    def _fail_unrunnable(self, pending, results, stuck=None):
+        """Fail jobs whose prerequisites failed, or all of them with reason stuck"""
+        changed = True
+        while changed:
+            changed = False
+            for job in list(pending):
+                failed = job.requires & self._failed
+                if not failed and not stuck:
+                    continue
+                pending.remove(job)
+                reason = f"prerequisite failed: {', '.join(sorted(failed))}" if failed else stuck
+                self._complete(JobResult(job, -1, stderr=f"Skipped, {reason}", started=time.monotonic()),
+                               pending, results)
+                changed = True
+
+    async def _schedule(self, pending, results):
+        hold_until = None
+        while pending or self._running or self._finished:
+            while not self._finished and self._next_job(pending) is None:
+                retry_at = self._retry_at(pending)
+                if self.cancelled and not self._stopped:
+                    break
+                if self._running or retry_at is not None:
+                    await self._sleep(None if retry_at is None else retry_at - time.monotonic())
+                elif self._throttled and hold_until is not None and time.monotonic() < hold_until:
+                    # Nothing running to wake us; poll until the throttle lets go
+                    await self._sleep(THROTTLE_POLL)
+                else:
+                    break
+            finished, self._finished = self._finished, []
+
+            for result in finished:
+                self._complete(result, pending, results)
+            if self.cancelled and not self._stopped:
+                self._stop(pending, results)
+            self._fail_unrunnable(pending, results)
+
+            started = []
+            job = self._next_job(pending)
+            while job is not None:
+                pending.remove(job)
+                self._running += 1
+                self._reserved += job.size
+                if job.lane is not None:
+                    self._busy_lanes.add(job.lane)
+                started.append(job)
+                job = self._next_job(pending)
+            idle = not self._running and not self._finished
+            if idle and self._retry_at(pending) is not None:
+                # Only waiting out a retry delay; the wait above sleeps until then
+                continue
+            if not (idle and pending and self._throttled):
+                hold_until = None
+            elif hold_until is None:
+                hold_until = time.monotonic() + self.throttle.max_wait
+                continue
+            if idle and pending:
+                stuck = "held back by resource limits" if self._throttled else "unsatisfiable dependencies"
+                self._fail_unrunnable(pending, results, stuck)
+
+            for job in started:
+                if self.on_start:
+                    self.on_start(job)
+                self._spawn(self._worker(job))
+
+    async def run_async(self, jobs):
+        """Run jobs on the running event loop; returns their JobResults"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+        pending = list(jobs)
+        now = time.monotonic()
+        for job in pending:
+            job.queued_at = now
+            self._planned |= job.provides
+        results = []
+        try:
+            try:
+                await self._schedule(pending, results)
+            except asyncio.CancelledError:
+                # Interrupted: wind down like cancel() instead of abandoning the jobs
+                task = asyncio.current_task()
+                if hasattr(task, 'uncancel'):
+                    task.uncancel()
+                self.cancelled = True
+                await self._schedule(pending, results)
+            # Let terminations still escalating to SIGKILL finish
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            self._loop = None
+            # A cancelled callable may still be running; do not wait for it
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def run(self, jobs):
+        """Run jobs to completion on a new event loop in this thread; returns their JobResults"""
+        return asyncio.run(self.run_async(jobs))
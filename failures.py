@@ -0,0 +1,79 @@
+import random
+import re
+
+# Failure classes, checked in this order against a failed job's output.
+# Permission comes first: apt run without root reports "Permission denied"
+# and "are you root?" next to its lock messages.
+PATTERNS = [
+    ('permission', re.compile(r"permission denied|are you root|must be run as root|requires root|"
+                              r"operation not permitted|access is denied|a password is required|"
+                              r"not in the sudoers|0x80070005", re.I)),
+    ('lock', re.compile(r"could not get lock|unable to acquire the dpkg frontend lock|"
+                        r"is another process using it|has \"\w+\" change in progress|"
+                        r"another active homebrew .*process|has already locked|"
+                        r"another installation is already in progress", re.I)),
+    ('not_found', re.compile(r"unable to locate package|has no installation candidate|snap \"[^\"]*\" not found|"
+                             r"no available formula|no cask with this name|"
+                             r"no package found matching input criteria", re.I)),
+    ('network', re.compile(r"temporary failure (in name resolution|resolving)|could not resolve|failed to fetch|"
+                           r"connection (timed out|refused|reset)|network is unreachable|timed out|"
+                           r"failed to connect|unable to contact snap store|tls handshake|"
+                           r"max retries exceeded|0x80072ee[27]", re.I)),
+]
+
+# Exit codes that say enough on their own
+EXIT_CODES = {
+    127: 'not_found',     # shell: command not found
+    1618: 'lock',         # Windows Installer: another installation in progress
+}
+
+LABELS = {
+    'lock': "package manager lock held",
+    'network': "network error",
+    'not_found': "package not found",
+    'permission': "permission denied",
+    'other': "install error",
+    'cancelled': "cancelled",
+}
+
+# Retries allowed per failure class; the others are not worth retrying
+RETRY_ATTEMPTS = {'lock': 6, 'network': 4}
+RETRY_BASE_DELAY = 2.0
+RETRY_MAX_DELAY = 60.0
+
+def classify(returncode, stderr='', stdout=''):
+    """Failure class of a nonzero exit: lock, network, not_found, permission or other"""
+    text = f"{stderr}\n{stdout}"
+    for kind, pattern in PATTERNS:
+        if pattern.search(text):
+            return kind
+    return EXIT_CODES.get(returncode, 'other')
+
+def last_line(text):
+    """The last non-empty line of some output, for one-line error reports"""
+    for line in reversed((text or '').splitlines()):
+        if line.strip():
+            return line.strip()
+    return ''
+
+class RetryPolicy:
+    """Exponential backoff with jitter for transient failures.
+
+    A job that failed with a class in attempts is retried up to that many
+    times. The n-th retry waits between half and all of
+    min(max_delay, base_delay * 2**n) seconds, picked at random so several
+    jobs blocked on the same lock do not all come back at once.
+    """
+
+    def __init__(self, attempts=None, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, rng=None):
+        self.attempts = RETRY_ATTEMPTS if attempts is None else attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng or random.Random()
+
+    def delay(self, result):
+        """Seconds to wait before retrying result's job, or None to give up"""
+        if result.job.attempts >= self.attempts.get(result.failure, 0):
+            return None
+        ceiling = min(self.max_delay, self.base_delay * 2 ** result.job.attempts)
+        return ceiling / 2 + self.rng.uniform(0, ceiling / 2)
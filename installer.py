@@ -1,15 +1,41 @@
 import os
-import sys
 import subprocess
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
+from tkinter import ttk, messagebox, scrolledtext, simpledialog, filedialog
 from threading import Thread
 import platform
-import requests
-import tempfile
-import shutil
+import queue
 import time
-import psutil
+from backends import OS_BACKENDS, BackendDiscovery, backends_for
+from catalog import current_os, get_catalog
+from engine import DEFAULT_JOBS, MAX_JOBS
+from journal import Journal, discard, unfinished
+from profiles import export_profile, list_profiles, load_profile, save_profile
+from search import SearchIndex
+from session import InstallSession, describe, format_failures
+from tracing import TRACE_PATH, Tracer
+
+# Install log limits: events from the worker threads go through a bounded
+# queue that the Tk thread drains on a timer, and the log keeps only the
+# newest MAX_LOG_LINES lines
+EVENT_QUEUE_SIZE = 1000
+EVENT_BATCH = 500
+EVENT_POLL_MS = 100
+MAX_LOG_LINES = 2000
+
+# Software list: row widgets exist only for the rows on screen, and the
+# search box filters once typing pauses for SEARCH_DELAY_MS
+ROW_HEIGHT = 22
+WHEEL_ROWS = 3
+SEARCH_DELAY_MS = 150
+# Failed packages listed in the end-of-run dialog; the log has all of them
+MAX_REPORTED_FAILURES = 20
+
+MISSING_BACKEND_MESSAGES = {
+    'winget': "Winget package manager not found. Please install it first.",
+    'brew': "Homebrew package manager not found. Please install it first.",
+    'apt': "APT package manager not found.",
+}
 
 # Software Information
 __version__ = "1.0.1"
@@ -45,6 +71,7 @@ def check_windows_activation():
         return False
 
 def download_activator():
+    import requests
     url = "https://raw.githubusercontent.com/massgravel/Microsoft-Activation-Scripts/master/MAS/All-In-One-Version/MAS_AIO.cmd"
     try:
         response = requests.get(url)
@@ -56,24 +83,8 @@ def download_activator():
         return False
     return False
 
-def check_system_resources():
-    """Check system resources before installation"""
-    cpu_percent = psutil.cpu_percent()
-    memory = psutil.virtual_memory()
-    disk = psutil.disk_usage('/')
-    
-    warnings = []
-    if cpu_percent > 80:
-        warnings.append("High CPU usage detected")
-    if memory.percent > 80:
-        warnings.append("Low memory available") 
-    if disk.percent > 90:
-        warnings.append("Low disk space")
-        
-    return warnings
-
 class InstallationWindow(tk.Toplevel):
-    def __init__(self, parent):
+    def __init__(self, parent, on_cancel=None):
         super().__init__(parent)
         self.title("Zapinstall")
         self.geometry("350x250")
@@ -114,6 +125,31 @@ class InstallationWindow(tk.Toplevel):
         self.status_label = ttk.Label(progress_frame, text="Ready to install", font=('Arial', 9), style="Custom.TLabel")
         self.status_label.pack(pady=(2,0))
 
+        # Stops jobs that have not started and kills the running ones
+        self.cancel_button = ttk.Button(progress_frame, text="Cancel", command=on_cancel, style="Custom.TButton")
+        self.cancel_button.pack(pady=(3,0))
+
+        self.main_frame = main_frame
+
+    def show_summary(self, rows):
+        """Show per-phase and per-job timings in a table below the log"""
+        columns = ('wait', 'run', 'exit')
+        table = ttk.Treeview(self.main_frame, columns=columns, height=min(len(rows), 8))
+        table.heading('#0', text="Step")
+        table.heading('wait', text="Wait")
+        table.heading('run', text="Run")
+        table.heading('exit', text="Exit")
+        table.column('#0', width=170)
+        for column in columns:
+            table.column(column, width=55, anchor='e')
+        for name, wait, run, exit_code in rows:
+            table.insert('', tk.END, text=name, values=(
+                f"{wait:.1f}s" if wait is not None else '',
+                f"{run:.1f}s",
+                '' if exit_code is None else exit_code))
+        table.pack(fill='x', padx=2, pady=2)
+        self.geometry("")
+
 class AboutWindow(tk.Toplevel):
     def __init__(self, parent):
         super().__init__(parent)
@@ -145,6 +181,103 @@ class AboutWindow(tk.Toplevel):
         about_text.insert('1.0', __about__)
         about_text.configure(state='disabled')
 
+class VirtualList(ttk.Frame):
+    """Scrolling list of category headers and checkable entries.
+
+    rows is a list of ('header', category) and ('item', name) pairs. Only
+    enough widgets to fill the visible height are created; scrolling
+    rebinds them to other rows. Check state lives in the shared selected
+    set, and is_disabled(name) greys an entry out.
+    """
+
+    def __init__(self, parent, selected, is_disabled, on_toggle=None):
+        super().__init__(parent)
+        self.selected = selected
+        self.is_disabled = is_disabled
+        self.on_toggle = on_toggle
+        self.rows = []
+        self.top = 0
+        self.slots = []
+        self.body = tk.Frame(self, bg="white")
+        self.body.pack(side='left', fill='both', expand=True)
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.yview)
+        self.scrollbar.pack(side='right', fill='y')
+        self.body.bind('<Configure>', lambda e: self.redraw())
+        self._bind_wheel(self.body)
+
+    def _bind_wheel(self, widget):
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            widget.bind(sequence, self.on_wheel)
+
+    def _add_slot(self):
+        var = tk.BooleanVar()
+        index = len(self.slots)
+        check = ttk.Checkbutton(self.body, variable=var, style="Custom.TCheckbutton",
+                                command=lambda: self._toggle(index))
+        header = ttk.Label(self.body, font=('Arial', 9, 'bold'), foreground="black", background="white")
+        self._bind_wheel(check)
+        self._bind_wheel(header)
+        self.slots.append((check, header, var))
+
+    def visible_rows(self):
+        return max(1, self.body.winfo_height() // ROW_HEIGHT)
+
+    def set_rows(self, rows):
+        self.rows = rows
+        self.top = 0
+        self.redraw()
+
+    def redraw(self):
+        count = self.visible_rows()
+        while len(self.slots) < count:
+            self._add_slot()
+        self.top = max(0, min(self.top, len(self.rows) - count))
+        for k, (check, header, var) in enumerate(self.slots):
+            index = self.top + k
+            if k >= count or index >= len(self.rows):
+                check.place_forget()
+                header.place_forget()
+                continue
+            kind, text = self.rows[index]
+            if kind == 'header':
+                check.place_forget()
+                header.config(text=text)
+                header.place(x=0, y=k * ROW_HEIGHT, relwidth=1, height=ROW_HEIGHT)
+            else:
+                header.place_forget()
+                var.set(text in self.selected)
+                check.config(text=text)
+                check.state(['disabled'] if self.is_disabled(text) else ['!disabled'])
+                check.place(x=12, y=k * ROW_HEIGHT, relwidth=1, width=-12, height=ROW_HEIGHT)
+        if self.rows:
+            self.scrollbar.set(self.top / len(self.rows), min(1.0, (self.top + count) / len(self.rows)))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _toggle(self, k):
+        name = self.rows[self.top + k][1]
+        if self.slots[k][2].get():
+            self.selected.add(name)
+        else:
+            self.selected.discard(name)
+        # The same entry can be on screen under another category too
+        self.redraw()
+        if self.on_toggle:
+            self.on_toggle()
+
+    def yview(self, *args):
+        count = self.visible_rows()
+        if args[0] == 'moveto':
+            self.top = int(float(args[1]) * len(self.rows))
+        elif args[0] == 'scroll':
+            self.top += int(args[1]) * (count if args[2] == 'pages' else 1)
+        self.redraw()
+
+    def on_wheel(self, event):
+        up = event.num == 4 or getattr(event, 'delta', 0) > 0
+        self.top += -WHEEL_ROWS if up else WHEEL_ROWS
+        self.redraw()
+
 class SoftwareInstaller:
     def __init__(self):
         self.window = tk.Tk()
@@ -160,8 +293,6 @@ class SoftwareInstaller:
         
         # Configure style
         style = ttk.Style()
-        style.configure("Category.TLabelframe", font=('Arial', 9, 'bold'), background="white", foreground="black")
-        style.configure("Category.TLabelframe.Label", font=('Arial', 9, 'bold'), background="white", foreground="black")
         style.configure("Custom.TButton", padding=3, background="white", foreground="black")
         style.configure("Custom.TCheckbutton", background="white", foreground="black")
         style.configure("Disabled.TButton", padding=3, background="gray", foreground="gray")
@@ -169,75 +300,32 @@ class SoftwareInstaller:
         # Check Windows activation status
         self.is_activated = check_windows_activation() if platform.system() == "Windows" else False
         
-        # Extended software dictionary
-        self.software = {
-            'Development': {
-                'VS Code': {'cmd': 'winget install Microsoft.VisualStudioCode', 'linux': 'sudo snap install code --classic', 'mac': 'brew install --cask visual-studio-code'},
-                'PyCharm': {'cmd': 'winget install JetBrains.PyCharm.Community', 'linux': 'sudo snap install pycharm-community --classic', 'mac': 'brew install --cask pycharm-ce'},
-                'Git': {'cmd': 'winget install Git.Git', 'linux': 'sudo apt install git -y', 'mac': 'brew install git'},
-                'Python': {'cmd': 'winget install Python.Python.3', 'linux': 'sudo apt install python3 -y', 'mac': 'brew install python3'},
-                'Node.js': {'cmd': 'winget install OpenJS.NodeJS', 'linux': 'sudo apt install nodejs -y', 'mac': 'brew install node'},
-                'Docker': {'cmd': 'winget install Docker.DockerDesktop', 'linux': 'sudo apt install docker.io -y', 'mac': 'brew install --cask docker'},
-                'IntelliJ': {'cmd': 'winget install JetBrains.IntelliJIDEA.Community', 'linux': 'sudo snap install intellij-idea-community --classic', 'mac': 'brew install --cask intellij-idea-ce'},
-                'Android Studio': {'cmd': 'winget install Google.AndroidStudio', 'linux': 'sudo snap install android-studio --classic', 'mac': 'brew install --cask android-studio'},
-                'Sublime Text': {'cmd': 'winget install SublimeHQ.SublimeText', 'linux': 'sudo snap install sublime-text --classic', 'mac': 'brew install --cask sublime-text'},
-                'Eclipse': {'cmd': 'winget install EclipseFoundation.Eclipse', 'linux': 'sudo snap install eclipse --classic', 'mac': 'brew install --cask eclipse-ide'}
-            },
-            'Browsers': {
-                'Chrome': {'cmd': 'winget install Google.Chrome', 'linux': 'wget https://dl.google.com/linux/direct/google-chrome-stable_current_amd64.deb && sudo dpkg -i google-chrome-stable_current_amd64.deb', 'mac': 'brew install --cask google-chrome'},
-                'Firefox': {'cmd': 'winget install Mozilla.Firefox', 'linux': 'sudo apt install firefox -y', 'mac': 'brew install --cask firefox'},
-                'Brave': {'cmd': 'winget install BraveSoftware.BraveBrowser', 'linux': 'sudo snap install brave', 'mac': 'brew install --cask brave-browser'},
-                'Opera': {'cmd': 'winget install Opera.Opera', 'linux': 'sudo snap install opera', 'mac': 'brew install --cask opera'},
-                'Edge': {'cmd': 'winget install Microsoft.Edge', 'linux': 'sudo snap install microsoft-edge-stable --classic', 'mac': 'brew install --cask microsoft-edge'},
-                'Vivaldi': {'cmd': 'winget install VivaldiTechnologies.Vivaldi', 'linux': 'sudo snap install vivaldi', 'mac': 'brew install --cask vivaldi'},
-                'Tor Browser': {'cmd': 'winget install TorProject.TorBrowser', 'linux': 'sudo apt install torbrowser-launcher -y', 'mac': 'brew install --cask tor-browser'}
-            },
-            'Utilities': {
-                'Postman': {'cmd': 'winget install Postman.Postman', 'linux': 'sudo snap install postman', 'mac': 'brew install --cask postman'},
-                '7-Zip': {'cmd': 'winget install 7zip.7zip', 'linux': 'sudo apt install p7zip-full -y', 'mac': 'brew install p7zip'},
-                'VLC': {'cmd': 'winget install VideoLAN.VLC', 'linux': 'sudo apt install vlc -y', 'mac': 'brew install --cask vlc'},
-                'OBS Studio': {'cmd': 'winget install OBSProject.OBSStudio', 'linux': 'sudo apt install obs-studio -y', 'mac': 'brew install --cask obs'},
-                'FileZilla': {'cmd': 'winget install TimKosse.FileZilla', 'linux': 'sudo apt install filezilla -y', 'mac': 'brew install --cask filezilla'},
-                'WinSCP': {'cmd': 'winget install WinSCP.WinSCP', 'linux': 'sudo apt install winscp -y', 'mac': 'brew install --cask winscp'},
-                'Putty': {'cmd': 'winget install PuTTY.PuTTY', 'linux': 'sudo apt install putty -y', 'mac': 'brew install --cask putty'},
-                'TeamViewer': {'cmd': 'winget install TeamViewer.TeamViewer', 'linux': 'sudo snap install teamviewer', 'mac': 'brew install --cask teamviewer'},
-                'Remmina': {'cmd': 'winget install Remmina.Remmina', 'linux': 'sudo apt install remmina -y', 'mac': 'brew install --cask remmina'},
-                'Etcher': {'cmd': 'winget install Balena.Etcher', 'linux': 'sudo apt install balena-etcher -y', 'mac': 'brew install --cask balenaetcher'}
-            },
-            'Communication': {
-                'Discord': {'cmd': 'winget install Discord.Discord', 'linux': 'sudo snap install discord', 'mac': 'brew install --cask discord'},
-                'Slack': {'cmd': 'winget install SlackTechnologies.Slack', 'linux': 'sudo snap install slack', 'mac': 'brew install --cask slack'},
-                'Zoom': {'cmd': 'winget install Zoom.Zoom', 'linux': 'sudo snap install zoom-client', 'mac': 'brew install --cask zoom'},
-                'Teams': {'cmd': 'winget install Microsoft.Teams', 'linux': 'sudo snap install teams', 'mac': 'brew install --cask microsoft-teams'},
-                'Skype': {'cmd': 'winget install Microsoft.Skype', 'linux': 'sudo snap install skype', 'mac': 'brew install --cask skype'},
-                'Telegram': {'cmd': 'winget install Telegram.TelegramDesktop', 'linux': 'sudo snap install telegram-desktop', 'mac': 'brew install --cask telegram'},
-                'Signal': {'cmd': 'winget install OpenWhisperSystems.Signal', 'linux': 'sudo snap install signal-desktop', 'mac': 'brew install --cask signal'},
-                'Element': {'cmd': 'winget install Element.Element', 'linux': 'sudo apt install element-desktop -y', 'mac': 'brew install --cask element'}
-            },
-            'Media': {
-                'Spotify': {'cmd': 'winget install Spotify.Spotify', 'linux': 'sudo snap install spotify', 'mac': 'brew install --cask spotify'},
-                'Steam': {'cmd': 'winget install Valve.Steam', 'linux': 'sudo apt install steam -y', 'mac': 'brew install --cask steam'},
-                'Audacity': {'cmd': 'winget install Audacity.Audacity', 'linux': 'sudo apt install audacity -y', 'mac': 'brew install --cask audacity'},
-                'GIMP': {'cmd': 'winget install GIMP.GIMP', 'linux': 'sudo apt install gimp -y', 'mac': 'brew install --cask gimp'},
-                'Blender': {'cmd': 'winget install BlenderFoundation.Blender', 'linux': 'sudo snap install blender --classic', 'mac': 'brew install --cask blender'},
-                'Inkscape': {'cmd': 'winget install Inkscape.Inkscape', 'linux': 'sudo apt install inkscape -y', 'mac': 'brew install --cask inkscape'},
-                'Krita': {'cmd': 'winget install KDE.Krita', 'linux': 'sudo snap install krita', 'mac': 'brew install --cask krita'},
-                'HandBrake': {'cmd': 'winget install HandBrake.HandBrake', 'linux': 'sudo snap install handbrake-jz', 'mac': 'brew install --cask handbrake'},
-                'OBS Studio': {'cmd': 'winget install OBSProject.OBSStudio', 'linux': 'sudo apt install obs-studio -y', 'mac': 'brew install --cask obs'},
-                'DaVinci Resolve': {'cmd': 'winget install Blackmagic.DaVinciResolve', 'linux': 'sudo snap install davinci-resolve', 'mac': 'brew install --cask davinci-resolve'}
-            },
-            'Security': {
-                'Wireshark': {'cmd': 'winget install WiresharkFoundation.Wireshark', 'linux': 'sudo apt install wireshark -y', 'mac': 'brew install --cask wireshark'},
-                'Bitwarden': {'cmd': 'winget install Bitwarden.Bitwarden', 'linux': 'sudo snap install bitwarden', 'mac': 'brew install --cask bitwarden'},
-                'KeePass': {'cmd': 'winget install DominikReichl.KeePass', 'linux': 'sudo apt install keepass2 -y', 'mac': 'brew install --cask keepass'},
-                'VeraCrypt': {'cmd': 'winget install IDRIX.VeraCrypt', 'linux': 'sudo apt install veracrypt -y', 'mac': 'brew install --cask veracrypt'},
-                'Nmap': {'cmd': 'winget install Insecure.Nmap', 'linux': 'sudo apt install nmap -y', 'mac': 'brew install nmap'},
-                'OpenVPN': {'cmd': 'winget install OpenVPNTechnologies.OpenVPN', 'linux': 'sudo apt install openvpn -y', 'mac': 'brew install --cask openvpn-connect'}
-            }
-        }
-
-        self.selected_software = {}
+        self.software = get_catalog()
+
+        # Names of the checked entries; the list only has widgets for the
+        # rows on screen, so selection is not kept in per-entry variables
+        self.selected = set()
+        self.matches = list(self.software)
+        self.search_index = None
+        self._search_job = None
+        self.jobs_var = tk.IntVar(value=DEFAULT_JOBS)
+        # The running InstallSession; it runs on its own thread and reports
+        # only through self.events
+        self.session = None
+        self.install_window = None
+        self.events = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.unavailable = set()
+        # Package manager probe results once the 'backends' event arrives, and
+        # whether Install Selected was pressed before that
+        self.backend_results = None
+        self.install_queued = False
+        # Probe package managers in the background so the UI can grey out
+        # what cannot be installed and Install Selected never waits on them
+        self.backends = BackendDiscovery(OS_BACKENDS[current_os()]).start(
+            on_done=lambda results: self.events.put({'event': 'backends', 'results': results}))
         self.setup_gui()
+        self.window.after(EVENT_POLL_MS, self.drain_events)
+        self.window.after_idle(self.offer_resume)
 
     def activate_windows(self):
         if not os.path.exists("windows_activator.cmd"):
@@ -279,6 +367,8 @@ class SoftwareInstaller:
         
         ttk.Label(header_frame, text="Select Software to Install", font=('Arial', 11, 'bold'), foreground="black", background="white").pack(side='left')
         ttk.Button(header_frame, text="About", command=self.show_about, style="Custom.TButton").pack(side='right')
+        self.backend_label = ttk.Label(header_frame, text="Checking package managers...", font=('Arial', 8), foreground="gray", background="white")
+        self.backend_label.pack(side='right', padx=5)
 
         # Windows Activation Section (if on Windows)
         if platform.system() == "Windows":
@@ -295,39 +385,34 @@ class SoftwareInstaller:
                                             foreground="black", background="white")
             self.activation_label.pack(side='left', padx=5)
 
-        # Create outer frame for scrolling
-        outer_frame = ttk.Frame(main_frame)
-        outer_frame.pack(fill='both', expand=True)
-
-        # Add canvas and scrollbar
-        canvas = tk.Canvas(outer_frame, bg="white", highlightthickness=0)
-        scrollbar = ttk.Scrollbar(outer_frame, orient="vertical", command=canvas.yview)
-        scrollbar.pack(side="right", fill="y")
-
-        canvas.pack(side="left", fill="both", expand=True)
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        inner_frame = ttk.Frame(canvas)
-        canvas.create_window((0, 0), window=inner_frame, anchor="nw")
-
-        # Create category frames in 2 columns
-        col, row = 0, 0
-        for category, software_dict in self.software.items():
-            category_frame = ttk.LabelFrame(inner_frame, text=category, padding=3, style="Category.TLabelframe")
-            category_frame.grid(row=row, column=col, sticky='nsew', padx=2, pady=2)
-            
-            for i, (name, _) in enumerate(software_dict.items()):
-                var = tk.BooleanVar()
-                self.selected_software[name] = var
-                cb = ttk.Checkbutton(category_frame, text=name, variable=var, style="Custom.TCheckbutton")
-                cb.grid(row=i, column=0, sticky='w', padx=3, pady=1)
-            
-            col = (col + 1) % 2
-            if col == 0:
-                row += 1
-
-        inner_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        canvas.bind_all("<MouseWheel>", lambda e: canvas.yview_scroll(int(-1*(e.delta/120)), "units"))
+        # Search box: matches names and categories as you type
+        search_frame = ttk.Frame(main_frame)
+        search_frame.pack(fill='x', pady=(0, 3))
+        ttk.Label(search_frame, text="Search:", foreground="black", background="white").pack(side='left')
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add('write', lambda *args: self.schedule_search())
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
+        search_entry.pack(side='left', fill='x', expand=True, padx=3)
+        self.count_label = ttk.Label(search_frame, font=('Arial', 8), foreground="gray", background="white")
+        self.count_label.pack(side='right')
+
+        self.software_list = VirtualList(main_frame, self.selected, lambda name: name in self.unavailable,
+                                         on_toggle=self.update_count)
+        self.software_list.pack(fill='both', expand=True)
+
+        # Saved selection profiles; Apply installs whatever is missing
+        profile_frame = ttk.Frame(main_frame)
+        profile_frame.pack(fill='x', pady=(3, 0))
+        ttk.Label(profile_frame, text="Profile:", foreground="black", background="white").pack(side='left')
+        self.profile_var = tk.StringVar()
+        self.profile_box = ttk.Combobox(profile_frame, textvariable=self.profile_var, state='readonly', width=16,
+                                        values=list_profiles())
+        self.profile_box.pack(side='left', padx=3)
+        ttk.Button(profile_frame, text="Load", command=self.load_selected_profile, style="Custom.TButton").pack(side='left', padx=2)
+        ttk.Button(profile_frame, text="Apply", command=self.apply_profile, style="Custom.TButton").pack(side='left', padx=2)
+        ttk.Button(profile_frame, text="Save As...", command=self.save_profile_as, style="Custom.TButton").pack(side='left', padx=2)
+        ttk.Button(profile_frame, text="Export...", command=self.export_selected_profile, style="Custom.TButton").pack(side='left', padx=2)
+        self.apply_search()
 
         # Buttons frame
         btn_frame = ttk.Frame(main_frame)
@@ -336,110 +421,306 @@ class SoftwareInstaller:
         ttk.Button(btn_frame, text="Select All", command=self.select_all, style="Custom.TButton").pack(side='left', padx=2)
         ttk.Button(btn_frame, text="Deselect All", command=self.deselect_all, style="Custom.TButton").pack(side='left', padx=2)
         ttk.Button(btn_frame, text="Install Selected", command=self.install_selected, style="Custom.TButton").pack(side='right', padx=2)
+        ttk.Spinbox(btn_frame, from_=1, to=MAX_JOBS, width=3, textvariable=self.jobs_var).pack(side='right', padx=2)
+        ttk.Label(btn_frame, text="Parallel jobs:", foreground="black", background="white").pack(side='right')
+
+    def offer_resume(self):
+        """Offer to finish a run that was cut short (window closed, crash, reboot)"""
+        remaining = [name for name in unfinished() if name in self.software]
+        if not remaining:
+            return
+        preview = "\n".join(remaining[:10])
+        if len(remaining) > 10:
+            preview += f"\n...and {len(remaining) - 10} more"
+        if not messagebox.askyesno("Resume Installation",
+                                   f"A previous installation did not finish. Still to install:\n\n{preview}\n\n"
+                                   "Resume it now?"):
+            discard()
+            return
+        self.selected.clear()
+        self.selected.update(remaining)
+        self.refresh_list()
+        self.install_selected()
 
     def show_about(self):
         AboutWindow(self.window)
 
+    def load_selected_profile(self):
+        """Replace the selection with the chosen profile; False if there is none"""
+        name = self.profile_var.get()
+        if not name:
+            messagebox.showwarning("Warning", "Please choose a profile")
+            return False
+        try:
+            packages = load_profile(name)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Cannot load profile {name}: {e}")
+            return False
+        unknown = [package for package in packages if package not in self.software]
+        self.selected.clear()
+        self.selected.update(package for package in packages if package in self.software)
+        self.refresh_list()
+        if unknown:
+            messagebox.showwarning("Warning", f"Not in the catalog, ignored: {', '.join(unknown)}")
+        return True
+
+    def apply_profile(self):
+        # Installed entries are skipped before anything runs, so applying a
+        # profile the machine already matches is quick and spawns nothing
+        if not self.check_idle():
+            return
+        if self.load_selected_profile():
+            self.install_selected()
+
+    def save_profile_as(self):
+        if not self.selected:
+            messagebox.showwarning("Warning", "Please select software to save")
+            return
+        name = simpledialog.askstring("Save Profile", "Profile name:", parent=self.window)
+        if not name:
+            return
+        try:
+            save_profile(name, [package for package in self.software if package in self.selected])
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Cannot save profile: {e}")
+            return
+        self.profile_box.config(values=list_profiles())
+        self.profile_var.set(name)
+
+    def export_selected_profile(self):
+        name = self.profile_var.get()
+        if not name:
+            messagebox.showwarning("Warning", "Please choose a profile")
+            return
+        path = filedialog.asksaveasfilename(parent=self.window, defaultextension='.json', initialfile=f"{name}.json",
+                                            filetypes=[("Zapinstall profile", "*.json")])
+        if not path:
+            return
+        try:
+            export_profile(name, path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Cannot export profile: {e}")
+
+    def schedule_search(self):
+        if self._search_job is not None:
+            self.window.after_cancel(self._search_job)
+        self._search_job = self.window.after(SEARCH_DELAY_MS, self.apply_search)
+
+    def apply_search(self):
+        """Show the entries matching the search box, grouped by category"""
+        self._search_job = None
+        query = self.search_var.get()
+        if query.strip():
+            if self.search_index is None:
+                self.search_index = SearchIndex(self.software)
+            self.matches = self.search_index.search(query)
+            matching = set(self.matches)
+        else:
+            self.matches = list(self.software)
+            matching = None
+        rows = []
+        for category, names in self.software.categories.items():
+            shown = names if matching is None else [name for name in names if name in matching]
+            if shown:
+                rows.append(('header', category))
+                rows.extend(('item', name) for name in shown)
+        self.software_list.set_rows(rows)
+        self.update_count()
+
+    def update_count(self):
+        self.count_label.config(text=f"{len(self.matches)} of {len(self.software)} shown, "
+                                     f"{len(self.selected)} selected")
+
+    def refresh_list(self):
+        self.software_list.redraw()
+        self.update_count()
+
     def select_all(self):
-        for var in self.selected_software.values():
-            var.set(True)
+        """Select every entry matching the search"""
+        self.selected.update(name for name in self.matches if name not in self.unavailable)
+        self.refresh_list()
+
+    def show_backends(self, results):
+        """Grey out entries with no command for this OS or whose package manager is missing, then start a queued install"""
+        self.backend_results = results
+        self.backend_label.config(text=", ".join(
+            f"{name} {'✓' if info.available else 'missing'}" for name, info in results.items()))
+        os_type = current_os()
+        missing = {name for name, info in results.items() if not info.available}
+        self.unavailable.clear()
+        for name in self.software:
+            cmd = self.software.command(name, os_type)
+            if not cmd or backends_for(cmd) & missing:
+                self.unavailable.add(name)
+        self.selected -= self.unavailable
+        self.refresh_list()
+        if self.install_queued:
+            self.install_queued = False
+            self.install_selected()
 
     def deselect_all(self):
-        for var in self.selected_software.values():
-            var.set(False)
+        """Deselect every entry matching the search"""
+        self.selected.difference_update(self.matches)
+        self.refresh_list()
+
+    def install_window_open(self):
+        """Whether the install window exists; the user may close it mid-run"""
+        return self.install_window is not None and self.install_window.winfo_exists()
+
+    def close_install_window(self):
+        """Close the install window, cancelling the run (after asking) if it is still going"""
+        if self.session is not None:
+            if not messagebox.askyesno("Cancel Installation", "Installation is still running. Cancel it and close "
+                                       "this window?", parent=self.install_window):
+                return
+            self.session.cancel()
+        self.install_window.destroy()
 
     def log_output(self, message):
-        self.install_window.output_text.insert(tk.END, f"{message}\n")
-        self.install_window.output_text.see(tk.END)
-        self.install_window.output_text.update()
+        if not self.install_window_open():
+            return
+        output_text = self.install_window.output_text
+        output_text.insert(tk.END, f"{message}\n")
+        lines = int(output_text.index('end-1c').split('.')[0])
+        if lines > MAX_LOG_LINES:
+            output_text.delete('1.0', f"{lines - MAX_LOG_LINES + 1}.0")
+        output_text.see(tk.END)
+
+    def check_idle(self):
+        """False (after telling the user) while an install is running.
+
+        Runs must not overlap: each has its own scheduler, so two could
+        hold the dpkg lane at once, and a new journal would replace the one
+        the running install is still writing to.
+        """
+        if self.session is None:
+            return True
+        messagebox.showwarning("Warning", "An installation is already running")
+        return False
 
     def install_selected(self):
-        selected = [sw for sw, var in self.selected_software.items() if var.get()]
+        if not self.check_idle():
+            return
+        selected = [name for name in self.software if name in self.selected and name not in self.unavailable]
         
         if not selected:
             messagebox.showwarning("Warning", "Please select software to install")
             return
+        try:
+            self.software.resolve(selected)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
 
-        # Check system resources before installation
-        warnings = check_system_resources()
-        if warnings:
-            warning_msg = "\n".join(warnings)
-            if not messagebox.askyesno("System Resource Warning", 
-                                     f"The following issues were detected:\n\n{warning_msg}\n\nDo you want to continue anyway?"):
-                return
-
-        # Check package manager availability
-        os_type = 'cmd' if sys.platform == 'win32' else 'linux' if sys.platform.startswith('linux') else 'mac'
-        
-        if os_type == 'cmd':
-            try:
-                subprocess.run(['winget', '--version'], capture_output=True, check=True)
-            except:
-                messagebox.showerror("Error", "Winget package manager not found. Please install it first.")
-                return
-        elif os_type == 'mac':
-            try:
-                subprocess.run(['brew', '--version'], capture_output=True, check=True) 
-            except:
-                messagebox.showerror("Error", "Homebrew package manager not found. Please install it first.")
-                return
-        elif os_type == 'linux':
-            try:
-                subprocess.run(['apt', '--version'], capture_output=True, check=True)
-            except:
-                messagebox.showerror("Error", "APT package manager not found.")
-                return
-            try:
-                subprocess.run(['snap', '--version'], capture_output=True, check=True)
-            except:
-                self.log_output("Warning: Snap not found. Some packages may fail to install.")
+        # Package managers are probed in the background at startup; rather
+        # than wait for them here on the Tk thread, install once they are known
+        backends = self.backend_results
+        if backends is None:
+            self.install_queued = True
+            self.backend_label.config(text="Checking package managers, installing when done...")
+            return
+        tracer = Tracer()
+        probes = self.backends.take_timings()
+        if probes:
+            tracer.record("Probe package managers", 'phase', min(start for start, _ in probes.values()),
+                          max(end for _, end in probes.values()), backends=sorted(probes))
+        required, *optional = OS_BACKENDS[current_os()]
+        if not backends[required].available:
+            messagebox.showerror("Error", MISSING_BACKEND_MESSAGES[required])
+            return
+        backend_warnings = [f"Warning: {name.capitalize()} not found. Some packages may fail to install."
+                            for name in optional if not backends[name].available]
 
-        self.install_window = InstallationWindow(self.window)
+        self.install_window = InstallationWindow(self.window, on_cancel=self.cancel_install)
+        self.install_window.protocol("WM_DELETE_WINDOW", self.close_install_window)
         self.install_window.output_text.delete(1.0, tk.END)
         self.install_window.progress['value'] = 0
-        Thread(target=self.install_thread, args=(selected,), daemon=True).start()
+        for warning in backend_warnings:
+            self.log_output(warning)
+        try:
+            max_workers = self.jobs_var.get()
+        except tk.TclError:
+            max_workers = DEFAULT_JOBS
+        self.session = InstallSession(selected, self.events.put, max_workers, tracer=tracer, journal=Journal())
+        Thread(target=self.install_thread, args=(self.session,), name='install-engine', daemon=True).start()
+
+    def cancel_install(self):
+        """Cancel the running install; the session reports the outcome through the event queue"""
+        if self.session is None:
+            return
+        self.install_window.cancel_button.configure(state='disabled')
+        self.install_window.status_label.config(text="Cancelling...")
+        self.session.cancel()
 
-    def install_thread(self, selected):
-        total = len(selected)
-        os_type = 'cmd' if sys.platform == 'win32' else 'linux' if sys.platform.startswith('linux') else 'mac'
-        
-        self.log_output(f"Installing {total} packages...")
-        
-        if os_type == 'linux':
-            try:
-                self.log_output("Updating package lists...")
-                subprocess.run('sudo apt update', shell=True, check=True)
-            except:
-                self.log_output("Warning: Failed to update package lists")
-        
-        for i, software in enumerate(selected, 1):
-            try:
-                self.install_window.status_label.config(text=f"Installing {software}...")
-                self.log_output(f"\nInstalling {software}...")
-                
-                cmd = None
-                for category in self.software.values():
-                    if software in category:
-                        cmd = category[software][os_type]
-                        break
-                
-                if cmd:
-                    process = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-                    if process.returncode == 0:
-                        self.log_output(f"✓ {software} installed successfully")
-                    else:
-                        raise Exception(process.stderr)
-                
-                progress = (i / total) * 100
-                self.install_window.progress['value'] = progress
-                
-            except Exception as e:
-                self.log_output(f"❌ Failed to install {software}: {str(e)}")
-                messagebox.showerror("Error", f"Failed to install {software}")
+    def drain_events(self):
+        """Apply queued install events on the Tk thread, batching log lines"""
+        lines = []
+        try:
+            for _ in range(EVENT_BATCH):
+                try:
+                    event = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                # The summary gets its own table widget instead of log text
+                message = describe(event) if event['event'] != 'summary' else None
+                if message is not None:
+                    lines.append(message)
+                if lines and event['event'] == 'complete':
+                    # Show the whole log before the end-of-run dialog
+                    self.log_output('\n'.join(lines))
+                    lines = []
+                self.handle_event(event)
+            if lines:
+                self.log_output('\n'.join(lines))
+        finally:
+            # Keep draining even if an event could not be applied: the
+            # engine thread blocks once the bounded queue is full
+            self.window.after(EVENT_POLL_MS, self.drain_events)
+
+    def handle_event(self, event):
+        kind = event['event']
+        if kind == 'backends':
+            self.show_backends(event['results'])
+            return
+        if kind == 'complete':
+            self.session = None
+        if not self.install_window_open():
+            return
+        if kind == 'status':
+            self.install_window.status_label.config(text=event['message'])
+        elif kind == 'throttle':
+            # Show why installs slowed down or paused
+            self.install_window.status_label.config(text=describe(event))
+        elif kind == 'progress':
+            self.install_window.progress['value'] = (event['done'] / event['total']) * 100
+        elif kind == 'summary':
+            self.install_window.show_summary(event['rows'])
+        elif kind == 'complete':
+            self.install_window.cancel_button.configure(state='disabled')
+            # One report at the end instead of a dialog per failed package
+            if event.get('error'):
+                messagebox.showerror("Error", f"Installation failed: {event['error']}")
+            elif event['cancelled']:
+                messagebox.showinfo("Cancelled", f"Installation cancelled, {event['cancelled']} package(s) not installed.")
+            elif event['failures']:
+                messagebox.showwarning("Installation finished with errors", format_failures(event['failures'], limit=MAX_REPORTED_FAILURES))
+            else:
+                messagebox.showinfo("Success", "Installation complete!")
 
-        self.install_window.status_label.config(text="Installation complete!")
-        self.log_output("\nAll installations completed!")
-        messagebox.showinfo("Success", "Installation complete!")
+    def install_thread(self, session):
+        # The session's event loop runs here; the Tk thread only sees its events
+        try:
+            session.run()
+        except Exception as e:
+            # Still end the run, or the window would wait on it forever
+            self.events.put({'event': 'complete', 'installed': 0, 'failed': len(session.failed),
+                             'skipped': len(session.skipped), 'cancelled': 0, 'failures': [], 'error': str(e)})
+            return
+        try:
+            session.tracer.write_jsonl(TRACE_PATH)
+            self.events.put({'event': 'log', 'message': f"Trace written to {TRACE_PATH}"})
+        except OSError:
+            pass
 
     def run(self):
         self.window.mainloop()
@@ -0,0 +1,184 @@
+import json
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog import CACHE_DIR
+from planner import parse_command
+
+INDEX_PATH = os.path.join(CACHE_DIR, 'installed.json')
+INDEX_TTL = 6 * 60 * 60
+
+# One listing command per backend; each is run at most once per rebuild
+LIST_COMMANDS = {
+    'apt': ['dpkg-query', '-W', '-f=${Package}\t${Version}\t${db:Status-Abbrev}\n'],
+    'snap': ['snap', 'list'],
+    'brew': ['brew', 'list', '--formula', '--versions'],
+    'cask': ['brew', 'list', '--cask', '--versions'],
+    'winget': ['winget', 'list', '--accept-source-agreements', '--disable-interactivity'],
+}
+
+def _brew_prefix():
+    return os.environ.get('HOMEBREW_PREFIX') or ('/opt/homebrew' if os.path.isdir('/opt/homebrew') else '/usr/local')
+
+# Package databases whose mtime tells us a cached listing is out of date
+SOURCE_FILES = {
+    'apt': lambda: '/var/lib/dpkg/status',
+    'snap': lambda: '/var/lib/snapd/state.json',
+    'brew': lambda: os.path.join(_brew_prefix(), 'Cellar'),
+    'cask': lambda: os.path.join(_brew_prefix(), 'Caskroom'),
+}
+
+def parse_dpkg(output):
+    packages = {}
+    for line in output.splitlines():
+        parts = line.split('\t')
+        if len(parts) == 3 and parts[2].startswith('ii'):
+            packages[parts[0].split(':')[0]] = parts[1]
+    return packages
+
+def parse_columns(output):
+    """Parse `name version ...` listings (snap list, brew list --versions)"""
+    packages = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and parts[0] != 'Name':
+            packages[parts[0]] = parts[1]
+    return packages
+
+def parse_winget(output):
+    """Parse the fixed-width table printed by `winget list`"""
+    packages = {}
+    lines = output.splitlines()
+    for i, line in enumerate(lines):
+        if ' Id ' in line and 'Version' in line:
+            id_col = line.index(' Id ') + 1
+            version_col = line.index('Version', id_col)
+            break
+    else:
+        return packages
+    for line in lines[i + 1:]:
+        if not line.strip() or set(line.strip()) == {'-'}:
+            continue
+        package_id = line[id_col:version_col].strip()
+        rest = line[version_col:].split()
+        if package_id:
+            packages[package_id.lower()] = rest[0] if rest else ''
+    return packages
+
+PARSERS = {
+    'apt': parse_dpkg,
+    'snap': parse_columns,
+    'brew': parse_columns,
+    'cask': parse_columns,
+    'winget': parse_winget,
+}
+
+def _lookup_key(command):
+    """Return (backend, package) to look up for a parsed command, or None"""
+    if command.backend == 'wget':
+        return None
+    if command.backend == 'dpkg':
+        # A downloaded .deb is named <package>_<version>_<arch>.deb
+        return ('apt', os.path.basename(command.package).split('_')[0])
+    if command.backend == 'winget':
+        return ('winget', command.package.lower())
+    return (command.backend, command.package)
+
+def required_backends(cmds):
+    backends = set()
+    for cmd in cmds:
+        for command in parse_command(cmd):
+            key = _lookup_key(command)
+            if key and key[0] in LIST_COMMANDS:
+                backends.add(key[0])
+    return backends
+
+class InstalledIndex:
+    """Per-backend map of installed packages, cached on disk between runs"""
+
+    def __init__(self, path=INDEX_PATH, ttl=INDEX_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.backends = {}
+        self._read_cache()
+
+    def _read_cache(self):
+        try:
+            with open(self.path) as f:
+                self.backends = json.load(f).get('backends', {})
+        except (OSError, ValueError):
+            self.backends = {}
+
+    def _write_cache(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'backends': self.backends}, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def _is_fresh(self, backend):
+        cached = self.backends.get(backend)
+        if not cached or time.time() - cached['built'] > self.ttl:
+            return False
+        source = SOURCE_FILES.get(backend)
+        if source:
+            try:
+                return os.path.getmtime(source()) <= cached['built']
+            except OSError:
+                pass
+        return True
+
+    def _list(self, backend):
+        try:
+            process = subprocess.run(LIST_COMMANDS[backend], capture_output=True, text=True)
+        except OSError:
+            return None
+        if process.returncode != 0:
+            return None
+        return PARSERS[backend](process.stdout)
+
+    def load(self, backends):
+        """Make sure the given backends are indexed, rebuilding stale ones"""
+        stale = [b for b in backends if b in LIST_COMMANDS and not self._is_fresh(b)]
+        if not stale:
+            return self
+        built = time.time()
+        with ThreadPoolExecutor(max_workers=len(stale)) as pool:
+            listings = dict(zip(stale, pool.map(self._list, stale)))
+        for backend, packages in listings.items():
+            if packages is None:
+                # Backend missing or broken: treat everything as not installed
+                self.backends.pop(backend, None)
+            else:
+                self.backends[backend] = {'built': built, 'packages': packages}
+        self._write_cache()
+        return self
+
+    def invalidate(self):
+        self.backends = {}
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def packages(self, backend):
+        """{package: version} of what one backend has installed, as last loaded"""
+        cached = self.backends.get(backend)
+        return cached['packages'] if cached else {}
+
+    def is_installed(self, cmd):
+        """True if every package a catalog command installs is already present"""
+        keys = [_lookup_key(c) for c in parse_command(cmd)]
+        keys = [k for k in keys if k]
+        if not keys:
+            return False
+        for backend, package in keys:
+            cached = self.backends.get(backend)
+            if not cached or package not in cached['packages']:
+                return False
+        return True
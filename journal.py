@@ -0,0 +1,102 @@
+import json
+import os
+import time
+from threading import Lock
+
+from catalog import CACHE_DIR
+
+JOURNAL_PATH = os.path.join(CACHE_DIR, 'journal.jsonl')
+
+class Journal:
+    """Append-only log of one install run, so an interrupted run can be resumed.
+
+    Each line is a JSON object with an 'op': 'run' (the planned selection,
+    always the first line), 'started', 'succeeded', 'failed' or 'skipped'
+    (with the packages of one job), and 'end' once the run is over. Every
+    line is a single write() to an O_APPEND descriptor. Lines that change
+    what a resume would do are fsync'd; 'started' lines are not, since a
+    job that only started is rerun either way. A batch job writes one line
+    for all its packages, so the cost grows with jobs, not entries.
+    """
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self._fd = None
+        self._lock = Lock()
+
+    def begin(self, packages):
+        """Start a new journal for a run over packages, replacing the last one"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'op': 'run', 'ts': time.time(), 'packages': list(packages)}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        return self
+
+    def _write(self, op, packages=None, sync=True):
+        record = {'op': op, 'ts': time.time()}
+        if packages is not None:
+            record['packages'] = list(packages)
+        data = (json.dumps(record) + '\n').encode()
+        with self._lock:
+            if self._fd is None:
+                return
+            os.write(self._fd, data)
+            if sync:
+                os.fsync(self._fd)
+
+    def started(self, packages):
+        self._write('started', packages, sync=False)
+
+    def finished(self, packages, ok):
+        self._write('succeeded' if ok else 'failed', packages)
+
+    def skipped(self, packages):
+        self._write('skipped', packages)
+
+    def end(self):
+        self._write('end')
+        self.close()
+
+    def close(self):
+        """Stop writing without marking the run finished, so it can still be resumed"""
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+def unfinished(path=JOURNAL_PATH):
+    """Packages of an interrupted run that did not install, in planned order.
+
+    Empty if the last run finished (even with failures) or there is no
+    journal. A torn last line from a crash mid-write is ignored.
+    """
+    planned = []
+    done = set()
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                op = record.get('op')
+                if op == 'run':
+                    planned, done = record['packages'], set()
+                elif op in ('succeeded', 'skipped'):
+                    done.update(record['packages'])
+                elif op == 'end':
+                    return []
+    except OSError:
+        return []
+    return [name for name in planned if name not in done]
+
+def discard(path=JOURNAL_PATH):
+    """Forget the last run so it is not offered for resuming again"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,221 @@
+import os
+import shlex
+from collections import namedtuple
+from functools import partial
+from urllib.parse import urlsplit
+
+from engine import Job, LOCKED_BACKENDS, lane_for
+
+# Typical seconds per call for each backend, plus extra per package merged
+# into a batch; only used to estimate the critical path up front
+ESTIMATED_SECONDS = {
+    'apt': 20,
+    'dpkg': 15,
+    'snap': 40,
+    'brew': 30,
+    'cask': 45,
+    'winget': 60,
+    'wget': 20,
+    'download': 20,
+    'shell': 30,
+}
+ESTIMATED_PER_EXTRA_PACKAGE = 10
+
+# One package-manager action parsed out of a catalog command string
+Command = namedtuple('Command', ['backend', 'package', 'flags'])
+
+# Backends that accept several packages in one invocation. Snap only does
+# this when no per-snap flags (--classic, --channel) are given.
+BATCHABLE = {'apt', 'brew', 'cask', 'snap'}
+
+def _parse_segment(segment):
+    words = shlex.split(segment)
+    if words and words[0] == 'sudo':
+        words = words[1:]
+    if len(words) >= 3 and words[0] in ('apt', 'apt-get', 'snap', 'brew', 'winget') and words[1] == 'install':
+        backend = 'apt' if words[0] == 'apt-get' else words[0]
+        args = words[2:]
+        if backend == 'brew' and '--cask' in args:
+            backend = 'cask'
+            args = [a for a in args if a != '--cask']
+        packages = [a for a in args if not a.startswith('-')]
+        flags = tuple(a for a in args if a.startswith('-'))
+        if len(packages) == 1:
+            return Command(backend, packages[0], flags)
+    elif len(words) == 2 and words[0] == 'wget':
+        return Command('wget', words[1], ())
+    elif len(words) == 3 and words[0] == 'dpkg' and words[1] == '-i':
+        return Command('dpkg', words[2], ('-i',))
+    return Command('shell', segment.strip(), ())
+
+def parse_command(cmd):
+    """Split a catalog command string into (backend, package, flags) tuples"""
+    return [_parse_segment(segment) for segment in cmd.split('&&')]
+
+def format_command(backend, packages, flags=()):
+    """Build the shell command that installs packages with one backend call"""
+    names = ' '.join(shlex.quote(p) for p in packages)
+    extra = ''.join(f' {f}' for f in flags)
+    if backend == 'apt':
+        return f"sudo apt install {names}{extra}"
+    if backend == 'snap':
+        return f"sudo snap install {names}{extra}"
+    if backend == 'brew':
+        return f"brew install {names}{extra}"
+    if backend == 'cask':
+        return f"brew install --cask {names}{extra}"
+    if backend == 'winget':
+        return f"winget install {names}{extra}"
+    if backend == 'wget':
+        return f"wget {names}"
+    if backend == 'dpkg':
+        return f"sudo dpkg -i {names}"
+    return ' '.join(packages)
+
+def download_urls(cmd):
+    """URLs a catalog command fetches directly (wget) rather than via a package manager"""
+    return [c.package for c in parse_command(cmd) if c.backend == 'wget']
+
+def localize_command(cmd, fetch):
+    """Rewrite a download-then-install command to use local files.
+
+    fetch(url) returns the local path for a URL; the wget step is dropped
+    and later steps that refer to the downloaded file name use that path.
+    """
+    local = {}
+    steps = []
+    for command in parse_command(cmd):
+        if command.backend == 'wget':
+            local[os.path.basename(urlsplit(command.package).path)] = fetch(command.package)
+        elif command.backend == 'dpkg' and command.package in local:
+            steps.append(format_command('dpkg', [local[command.package]], command.flags))
+        else:
+            steps.append(format_command(command.backend, [command.package], command.flags))
+    return ' && '.join(steps)
+
+def _batch_key(commands):
+    if len(commands) != 1:
+        return None
+    command = commands[0]
+    if command.backend not in BATCHABLE:
+        return None
+    if command.backend == 'snap' and command.flags:
+        return None
+    return (command.backend, command.flags)
+
+def _levels(names, requires):
+    """Depth of each name in the dependency graph (0 = needs nothing planned)"""
+    levels = {}
+
+    def level(name, seen=()):
+        if name not in levels:
+            if name in seen:
+                raise ValueError(f"Dependency cycle through {name}")
+            deps = requires.get(name, set()) & names
+            levels[name] = 1 + max((level(d, seen + (name,)) for d in deps), default=-1)
+        return levels[name]
+
+    for name in names:
+        level(name)
+    return levels
+
+def plan_jobs(entries, fetch=None, requires=None, sizes=None, others=()):
+    """Turn (name, cmd) pairs into jobs, merging what can share one call.
+
+    A merged job carries a fallback list of single-package jobs; the
+    scheduler runs those instead if the batch fails, so every package
+    still gets its own success or failure. If fetch is given, commands that
+    download an installer get a separate download job calling fetch(url)
+    (e.g. a DownloadCache), and the install step waits on it instead of
+    running wget.
+
+    requires maps an entry name to the names it must be installed after.
+    Only entries at the same depth of that graph are merged, so batches can
+    never end up waiting on each other. others names entries that get jobs
+    of their own outside this plan; they are waited on like planned ones.
+    sizes maps entry names to the bytes of disk they need, summed into each
+    job's size.
+    """
+    requires = requires or {}
+    sizes = sizes or {}
+    names = {name for name, _ in entries} | set(others)
+    levels = _levels(names, requires)
+
+    def deps(name):
+        return set(requires.get(name, ())) & names - {name}
+
+    batches = {}
+    order = []
+    downloads = {}
+    for name, cmd in entries:
+        commands = parse_command(cmd)
+        key = _batch_key(commands)
+        if key is None:
+            job = Job(name, cmd, lane_for(cmd), requires=deps(name))
+            if fetch:
+                for url in download_urls(cmd):
+                    if url not in downloads:
+                        download = Job(f"Download {os.path.basename(urlsplit(url).path)}", None,
+                                       packages=[], provides={f"download:{url}"})
+                        download.action = partial(fetch, url)
+                        downloads[url] = download
+                        order.append(download)
+                    job.requires.add(f"download:{url}")
+                    job.prepare = partial(localize_command, cmd, fetch)
+            order.append(job)
+            continue
+        key += (levels[name],)
+        if key not in batches:
+            batches[key] = []
+            order.append(key)
+        batches[key].append((name, cmd, commands[0]))
+
+    jobs = []
+    for item in order:
+        if isinstance(item, Job):
+            jobs.append(item)
+            continue
+        backend, flags, _ = item
+        members = batches[item]
+        lane = LOCKED_BACKENDS.get(backend)
+        if len(members) == 1:
+            name, cmd, _ = members[0]
+            jobs.append(Job(name, cmd, lane, requires=deps(name)))
+            continue
+        fallback = [Job(name, cmd, lane, requires=deps(name)) for name, cmd, _ in members]
+        cmd = format_command(backend, [c.package for _, _, c in members], flags)
+        names_in_batch = [name for name, _, _ in members]
+        batch_requires = set().union(*(job.requires for job in fallback)) - set(names_in_batch)
+        jobs.append(Job(', '.join(names_in_batch), cmd, lane, packages=names_in_batch,
+                        fallback=fallback, requires=batch_requires))
+    for job in jobs:
+        for sized in [job] + job.fallback:
+            sized.size = sum(sizes.get(name, 0) for name in sized.packages)
+    return jobs
+
+def estimate_seconds(job):
+    """Rough duration of a job, used to find the critical path before running"""
+    if job.action is not None:
+        return ESTIMATED_SECONDS['download']
+    commands = parse_command(job.cmd)
+    base = sum(ESTIMATED_SECONDS.get(c.backend, ESTIMATED_SECONDS['shell']) for c in commands)
+    return base + ESTIMATED_PER_EXTRA_PACKAGE * (len(job.packages) - 1)
+
+def critical_path(jobs):
+    """Longest chain of dependent jobs by estimated time: (seconds, [jobs])"""
+    providers = {key: job for job in jobs for key in job.provides}
+    memo = {}
+
+    def longest(job):
+        if job not in memo:
+            best = (0.0, [])
+            for key in job.requires:
+                dep = providers.get(key)
+                if dep is not None and dep is not job:
+                    candidate = longest(dep)
+                    if candidate[0] > best[0]:
+                        best = candidate
+            memo[job] = (best[0] + estimate_seconds(job), best[1] + [job])
+        return memo[job]
+
+    return max((longest(job) for job in jobs), key=lambda path: path[0], default=(0.0, []))
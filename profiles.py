@@ -0,0 +1,58 @@
+import json
+import os
+import time
+
+PROFILE_DIR = os.path.join(os.path.expanduser('~'), '.config', 'zapinstall', 'profiles')
+
+def read_profile(path):
+    """Read catalog entry names from a profile file.
+
+    Either an exported profile (JSON with a 'packages' list) or plain text
+    with one entry name per line, where '#' starts a comment.
+    """
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith('{'):
+        try:
+            return list(json.loads(text)['packages'])
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f"{path} is not a Zapinstall profile")
+    names = [line.split('#', 1)[0].strip() for line in text.splitlines()]
+    return [name for name in names if name]
+
+def profile_path(name, directory=PROFILE_DIR):
+    if not name or os.sep in name or (os.altsep and os.altsep in name) or name.startswith('.'):
+        raise ValueError(f"Invalid profile name: {name!r}")
+    return os.path.join(directory, name + '.json')
+
+def list_profiles(directory=PROFILE_DIR):
+    try:
+        files = os.listdir(directory)
+    except OSError:
+        return []
+    return sorted(f[:-len('.json')] for f in files if f.endswith('.json'))
+
+def write_profile(path, name, packages):
+    """Write packages as a JSON profile file, replacing it atomically"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'name': name, 'saved': time.time(), 'packages': list(packages)}, f, indent=1)
+        f.write('\n')
+    os.replace(tmp, path)
+
+def save_profile(name, packages, directory=PROFILE_DIR):
+    write_profile(profile_path(name, directory), name, packages)
+
+def load_profile(name_or_path, directory=PROFILE_DIR):
+    """Entry names of a saved profile, or of a profile file if one exists at that path"""
+    if os.path.isfile(name_or_path):
+        return read_profile(name_or_path)
+    return read_profile(profile_path(name_or_path, directory))
+
+def export_profile(name, path, directory=PROFILE_DIR):
+    """Copy a saved profile to path, e.g. to apply it on other machines"""
+    write_profile(path, name, load_profile(name, directory))
+
+def delete_profile(name, directory=PROFILE_DIR):
+    os.remove(profile_path(name, directory))
@@ -0,0 +1,118 @@
+import os
+import time
+from collections import deque
+from threading import Event, Lock, Thread
+
+SAMPLE_INTERVAL = 1.0
+# Filesystem whose free space is watched: where packages get installed
+DISK_PATH = os.path.abspath(os.sep)
+
+# Halve the worker count when the recent average CPU or memory use is at or
+# above the high mark; add one back per sample once both are below the low mark
+CPU_HIGH = 90
+CPU_LOW = 60
+MEMORY_HIGH = 85
+MEMORY_LOW = 70
+CPU_WINDOW = 3
+# Free space kept on top of the sizes of the packages being installed
+DISK_RESERVE = 512 * 1024 * 1024
+# Seconds to stay paused with nothing running before giving up
+DISK_WAIT = 600
+
+def sample(path=DISK_PATH):
+    """One reading of CPU %, memory % and free disk bytes"""
+    import psutil
+
+    return {'t': time.monotonic(), 'cpu': psutil.cpu_percent(), 'memory': psutil.virtual_memory().percent,
+            'disk_free': psutil.disk_usage(path).free}
+
+class ResourceMonitor:
+    """Samples CPU, memory and free disk every interval seconds on a
+    background thread, passing each reading to on_sample(reading)."""
+
+    def __init__(self, on_sample, interval=SAMPLE_INTERVAL, path=DISK_PATH):
+        self.on_sample = on_sample
+        self.interval = interval
+        self.path = path
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        import psutil
+
+        # The first cpu_percent() call only sets the baseline
+        psutil.cpu_percent()
+        self._thread = Thread(target=self._run, name='resource-monitor', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.on_sample(sample(self.path))
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+class AdaptiveThrottle:
+    """Scheduler throttle driven by ResourceMonitor samples.
+
+    Under CPU or memory pressure the number of parallel jobs is halved
+    (never below one) and it grows back one job per calm sample. A job only
+    starts while free disk covers its size, the sizes of the jobs still
+    running and DISK_RESERVE; otherwise new jobs pause until space frees up.
+    on_change(state) is called with the new state dict whenever the limit
+    or the pause changes, from the sampler thread.
+    """
+
+    def __init__(self, max_workers, on_change=None, disk_reserve=DISK_RESERVE, max_wait=DISK_WAIT):
+        self.limit = max_workers
+        self.max_workers = max_workers
+        self.on_change = on_change
+        self.disk_reserve = disk_reserve
+        self.max_wait = max_wait
+        self.disk_free = None
+        # Why fewer jobs run than max_workers, and why new jobs are paused
+        # (None when they are not)
+        self.pressure = None
+        self.paused = None
+        self._blocked = None
+        self._cpu = deque(maxlen=CPU_WINDOW)
+        self._lock = Lock()
+
+    def workers(self, max_workers):
+        return min(max_workers, self.limit)
+
+    def admits(self, job, reserved):
+        with self._lock:
+            needed = job.size + reserved + self.disk_reserve
+            if self.disk_free is None or not job.size or self.disk_free >= needed:
+                return True
+            self._blocked = f"low disk space ({self.disk_free // 2**20} MB free, {needed // 2**20} MB needed)"
+            return False
+
+    def state(self):
+        return {'workers': self.limit, 'max_workers': self.max_workers, 'pressure': self.pressure,
+                'paused': self.paused}
+
+    def update(self, reading):
+        """Fold in one sample from a ResourceMonitor"""
+        with self._lock:
+            self._cpu.append(reading['cpu'])
+            cpu = sum(self._cpu) / len(self._cpu)
+            memory = reading['memory']
+            before = (self.limit, self.paused)
+            if cpu >= CPU_HIGH or memory >= MEMORY_HIGH:
+                self.limit = max(1, self.limit // 2)
+                self.pressure = f"CPU {cpu:.0f}%, memory {memory:.0f}%"
+            elif cpu < CPU_LOW and memory < MEMORY_LOW and self.limit < self.max_workers:
+                self.limit += 1
+                if self.limit == self.max_workers:
+                    self.pressure = None
+            self.disk_free = reading['disk_free']
+            # Paused if a job was refused for disk space since the last sample
+            self.paused, self._blocked = self._blocked, None
+            changed = (self.limit, self.paused) != before
+        if changed and self.on_change:
+            self.on_change(self.state())
@@ -0,0 +1,65 @@
+from array import array
+from bisect import bisect_left
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class SearchIndex:
+    """Incremental search over catalog entry names and categories.
+
+    Each entry's searchable text is its name followed by its categories,
+    lowercased. A query is split into terms and every term has to match:
+    terms of three or more characters match anywhere in the text and are
+    looked up through a trigram index (trigram -> ids of the entries that
+    contain it), then checked against the text; shorter terms match the
+    start of a word and are looked up in a sorted list of words.
+    """
+
+    def __init__(self, catalog):
+        self.names = list(catalog)
+        self.texts = [' '.join([name] + catalog.get(name)['categories']).lower() for name in self.names]
+        words = set()
+        trigrams = {}
+        for i, text in enumerate(self.texts):
+            words.update((word, i) for word in text.split())
+            for gram in _trigrams(text):
+                # ids go in ascending order, so every posting list is sorted
+                trigrams.setdefault(gram, array('I')).append(i)
+        self.words = sorted(words)
+        self.trigrams = trigrams
+
+    def _prefix(self, term):
+        ids = set()
+        for word, i in self.words[bisect_left(self.words, (term,)):]:
+            if not word.startswith(term):
+                break
+            ids.add(i)
+        return ids
+
+    def _substring(self, term):
+        postings = []
+        for gram in _trigrams(term):
+            posting = self.trigrams.get(gram)
+            if posting is None:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        ids = set(postings[0])
+        for posting in postings[1:]:
+            ids.intersection_update(posting)
+            if not ids:
+                break
+        return {i for i in ids if term in self.texts[i]}
+
+    def search(self, query):
+        """Names of the entries matching query, in catalog order"""
+        terms = sorted(set(query.lower().split()), key=len, reverse=True)
+        if not terms:
+            return list(self.names)
+        ids = None
+        for term in terms:
+            found = self._substring(term) if len(term) >= 3 else self._prefix(term)
+            ids = found if ids is None else ids & found
+            if not ids:
+                return []
+        return [self.names[i] for i in sorted(ids)]
@@ -0,0 +1,417 @@
+import subprocess
+import sys
+from functools import partial
+from threading import Event, Thread
+
+from catalog import current_os, find_command, get_catalog
+from engine import Job, Scheduler, DEFAULT_JOBS
+from failures import LABELS, RetryPolicy, last_line
+from inventory import InstalledIndex, required_backends
+from planner import critical_path, download_urls, plan_jobs
+from resources import AdaptiveThrottle, ResourceMonitor
+from tracing import Tracer, format_summary
+
+# Seconds between refreshes of sudo's cached credentials while jobs run;
+# well inside sudo's default 5-15 minute timestamp timeout
+SUDO_REFRESH = 60.0
+
+def describe(event):
+    """Human-readable log line for an install event, or None"""
+    kind = event['event']
+    if kind == 'log':
+        return event['message']
+    if kind == 'skipped':
+        return f"↷ {event['package']} is already installed, skipping"
+    if kind == 'diff':
+        if not event['missing']:
+            return "Everything selected is already installed"
+        return f"Installing {len(event['missing'])} packages ({event['installed']} already installed)..."
+    if kind == 'started':
+        return f"\nInstalling {event['job']}..."
+    if kind == 'output':
+        return f"[{event['job']}] {event['line']}"
+    if kind == 'plan':
+        if not event['critical_path']:
+            return None
+        return f"Critical path (~{event['estimate']:.0f}s): {' → '.join(event['critical_path'])}"
+    if kind == 'throttle':
+        if event['paused']:
+            return f"Pausing new installs: {event['paused']}"
+        if event['pressure']:
+            return f"Running at most {event['workers']} of {event['max_workers']} jobs ({event['pressure']})"
+        return f"Resuming with up to {event['workers']} parallel jobs"
+    if kind == 'retry':
+        return (f"{event['job']} failed ({LABELS[event['failure']]}), retrying in {event['delay']:.0f}s "
+                f"(attempt {event['attempt'] + 1})")
+    if kind == 'split':
+        return f"Batch install of {event['job']} failed, retrying one at a time..."
+    if kind == 'finished':
+        if event['ok']:
+            return f"✓ {event['package']} installed successfully"
+        if event['failure'] == 'cancelled':
+            return f"✗ {event['package']} cancelled"
+        return f"❌ Failed to install {event['package']} ({LABELS[event['failure']]}): {last_line(event['error'])}"
+    if kind == 'summary':
+        return "\n" + format_summary(event['rows'])
+    if kind == 'complete':
+        if event.get('error'):
+            return f"\nInstallation failed: {event['error']}"
+        if event['cancelled']:
+            message = f"\nInstallation cancelled, {event['cancelled']} package(s) not installed"
+            return message + ("\n" + format_failures(event['failures']) if event['failures'] else "")
+        if not event['failures']:
+            return "\nAll installations completed!"
+        return "\n" + format_failures(event['failures'])
+    return None
+
+def _unavailable(reason):
+    raise RuntimeError(reason)
+
+def _sudo(*args):
+    """Run sudo with args, output discarded; True if it succeeded"""
+    try:
+        return subprocess.run(['sudo', *args], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+    except OSError:
+        return False
+
+class SudoKeepAlive:
+    """Refreshes sudo's cached credentials every interval seconds on a
+    background thread, so jobs late in a long run (which use sudo -n) do
+    not fail because the timestamp expired."""
+
+    def __init__(self, interval=SUDO_REFRESH):
+        self.interval = interval
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._run, name='sudo-keepalive', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            _sudo('-n', '-v')
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+def format_failures(failures, limit=None):
+    """End-of-run report of the packages that failed, one line each (at most limit lines)"""
+    lines = [f"{len(failures)} package(s) failed to install:"]
+    for failure in failures[:limit]:
+        lines.append(f"  {failure['package']}: {LABELS[failure['failure']]} - {failure['error']}")
+    if limit is not None and len(failures) > limit:
+        lines.append(f"  ...and {len(failures) - limit} more (see the log)")
+    return '\n'.join(lines)
+
+class InstallSession:
+    """One install run over a selection, shared by the GUI and the command line.
+
+    Progress is reported as event dicts passed to emit(), each with an
+    'event' key (see describe()); emit() is called from several threads.
+    """
+
+    def __init__(self, selected, emit, max_workers=DEFAULT_JOBS, os_type=None, tracer=None, adaptive=True,
+                 journal=None, retry=True, bundle=None):
+        self.selected = list(selected)
+        self.emit = emit
+        self.max_workers = max_workers
+        self.os_type = os_type or current_os()
+        # Phases and jobs are timed here; a caller's Tracer can already hold
+        # steps it ran first (e.g. the GUI's package manager probes)
+        self.tracer = tracer or Tracer()
+        # Sample CPU, memory and disk and run fewer jobs under pressure
+        self.adaptive = adaptive
+        # Records the plan and each outcome so an interrupted run can resume
+        self.journal = journal
+        # Lock and network failures are retried with backoff
+        self.retry = RetryPolicy() if retry else None
+        # Install from a Bundle's files only, with no downloads
+        self.bundle = bundle
+        self.total = len(self.selected)
+        self.done = 0
+        self.failed = []
+        self.cancelled = []
+        self.cancel_requested = False
+        self._scheduler = None
+        self._downloads = None
+        self._monitor = None
+        self._keepalive = None
+        self.failures = []
+        self.skipped = []
+
+    def cancel(self):
+        """Stop the run as soon as possible; safe to call from any thread.
+
+        Jobs that have not started are dropped, running ones are terminated
+        and the journal is left open-ended so the run can be resumed.
+        """
+        self.cancel_requested = True
+        downloads = self._downloads
+        if downloads is not None:
+            downloads.cancel()
+        scheduler = self._scheduler
+        if scheduler is not None:
+            scheduler.cancel()
+
+    def _progress(self):
+        self.emit({'event': 'progress', 'done': self.done, 'total': self.total})
+
+    def _on_start(self, job):
+        if self.journal and job.packages:
+            self.journal.started(job.packages)
+        self.emit({'event': 'status', 'message': f"Installing {job.name}..."})
+        self.emit({'event': 'started', 'job': job.name, 'packages': job.packages})
+
+    def _on_output(self, job, stream, line):
+        self.emit({'event': 'output', 'job': job.name, 'stream': stream, 'line': line})
+
+    def _on_download(self, url, future):
+        if future.cancelled():
+            return
+        if future.exception():
+            self.emit({'event': 'log', 'message': f"Warning: Failed to download {url}: {future.exception()}"})
+        else:
+            self.emit({'event': 'log', 'message': f"Downloaded {url}"})
+
+    def _on_throttle(self, state):
+        self.emit({'event': 'throttle', **state})
+
+    def _on_sample(self, throttle, scheduler, reading):
+        throttle.update(reading)
+        self.tracer.counter('resources', reading['t'], cpu=reading['cpu'], memory=reading['memory'],
+                            disk_free_mb=reading['disk_free'] // 2**20, workers=throttle.limit)
+        scheduler.wake()
+
+    def _on_retry(self, result, delay):
+        job = result.job
+        self.tracer.record(job.name, 'job', result.started, result.started + result.duration,
+                           wait=round(result.wait, 6), exit_code=result.returncode,
+                           lane=job.lane, packages=job.packages, retry=job.attempts)
+        self.emit({'event': 'retry', 'job': job.name, 'packages': job.packages, 'failure': result.failure,
+                   'attempt': job.attempts, 'delay': delay, 'error': last_line(result.stderr)})
+
+    def _on_split(self, result):
+        self.tracer.record(result.job.name, 'job', result.started, result.started + result.duration,
+                           wait=round(result.wait, 6), exit_code=result.returncode,
+                           lane=result.job.lane, packages=result.job.packages, split=True)
+        self.emit({'event': 'split', 'job': result.job.name})
+
+    def _on_result(self, result):
+        job = result.job
+        if self.journal and job.packages:
+            self.journal.finished(job.packages, result.ok)
+        if job.queued_at is not None:
+            self.tracer.record(job.name, 'wait', job.queued_at, result.started)
+        self.tracer.record(job.name, 'job', result.started, result.started + result.duration,
+                           wait=round(result.wait, 6), exit_code=result.returncode,
+                           lane=job.lane, packages=job.packages)
+        failure = result.failure
+        for software in result.job.packages:
+            if result.cancelled:
+                self.cancelled.append(software)
+            elif not result.ok:
+                self.failed.append(software)
+                self.failures.append({'package': software, 'failure': failure, 'returncode': result.returncode,
+                                      'error': last_line(result.stderr or result.stdout)})
+            self.emit({'event': 'finished', 'package': software, 'job': result.job.name, 'ok': result.ok,
+                       'returncode': result.returncode, 'failure': failure, 'error': result.stderr,
+                       'duration': result.duration})
+            self.done += 1
+        self._progress()
+
+    def _from_bundle(self, entries, index):
+        """Swap entries' commands for the bundle's; returns the entries and {name: reason} for the rest"""
+        bundled = [name for name, _ in entries if name in self.bundle.entries]
+        self.emit({'event': 'status', 'message': "Verifying bundle checksums..."})
+        with self.tracer.span("Verify bundle") as span:
+            problems = self.bundle.verify(bundled, self.max_workers)
+            span['entries'] = len(bundled)
+            span['bad_files'] = len(problems)
+        local = []
+        unavailable = {}
+        for name, _ in entries:
+            if name not in self.bundle.entries:
+                unavailable[name] = "not in the bundle"
+                why = self.bundle.unsupported.get(name)
+            else:
+                bad = [f"{rel} ({problems[rel]})" for rel in self.bundle.files_of(name) if rel in problems]
+                if not bad:
+                    local.append((name, self.bundle.command(name, index.packages('apt'))))
+                    continue
+                unavailable[name] = why = f"bad bundle files: {', '.join(bad)}"
+            message = f"Warning: cannot install {name} from the bundle"
+            self.emit({'event': 'log', 'message': f"{message}: {why}" if why else message})
+        return local, unavailable
+
+    def run(self):
+        """Install the selection and its prerequisites; True if all of it installed.
+
+        Jobs run on an event loop in this thread; failures are listed
+        together, with their class, in the 'complete' event.
+        """
+        try:
+            return self._run()
+        except BaseException:
+            # e.g. Ctrl-C during apt update or an unwritable journal: stop
+            # what the run started, and leave the journal resumable
+            if self._downloads is not None:
+                self._downloads.cancel()
+            if self._monitor is not None:
+                self._monitor.stop()
+            if self._keepalive is not None:
+                self._keepalive.stop()
+            if self.journal:
+                self.journal.close()
+            raise
+
+    def _run(self):
+        # Raises ValueError on cycles and conflicts; callers check this up front
+        catalog = get_catalog()
+        resolved = catalog.resolve(self.selected)
+        added = [name for name in resolved if name not in self.selected]
+        if added:
+            self.emit({'event': 'log', 'message': f"Also installing prerequisites: {', '.join(added)}"})
+        self.selected = resolved
+        self.total = len(resolved)
+        if self.journal:
+            self.journal.begin(resolved)
+
+        entries = []
+        # Entries that fail without running, with the reason: the catalog
+        # has no command for this OS, or (below) the bundle cannot install them
+        unavailable = {}
+        for software in self.selected:
+            cmd = find_command(software, self.os_type)
+            if cmd:
+                entries.append((software, cmd))
+            else:
+                unavailable[software] = f"no command for {self.os_type}"
+
+        # Pre-flight: skip anything the package managers already report
+        self.emit({'event': 'status', 'message': "Checking installed software..."})
+        with self.tracer.span("Check installed software") as span:
+            backends = required_backends(cmd for _, cmd in entries)
+            index = InstalledIndex().load(backends)
+            span['backends'] = sorted(backends)
+        missing = []
+        for software, cmd in entries:
+            if index.is_installed(cmd):
+                self.skipped.append(software)
+                self.emit({'event': 'skipped', 'package': software})
+                self.done += 1
+            else:
+                missing.append((software, cmd))
+        if self.journal and self.skipped:
+            self.journal.skipped(self.skipped)
+        entries = missing
+        self._progress()
+
+        self.emit({'event': 'diff', 'installed': len(self.skipped), 'missing': [name for name, _ in entries]})
+
+        if self.bundle:
+            entries, not_bundled = self._from_bundle(entries, index)
+            unavailable.update(not_bundled)
+
+        use_sudo = self.os_type != 'cmd' and any('sudo' in cmd.split() for _, cmd in entries)
+        if use_sudo and not self.cancel_requested and sys.stdin is not None and sys.stdin.isatty() \
+                and not _sudo('-n', 'true'):
+            # Jobs run in process groups of their own, where sudo cannot
+            # prompt on the terminal (they run it with -n); ask for the
+            # password once up front. Without a terminal, or if this fails,
+            # each job's sudo -n still decides for itself (e.g. NOPASSWD
+            # rules for the package managers only).
+            try:
+                if subprocess.run(['sudo', '-v']).returncode != 0:
+                    self.emit({'event': 'log', 'message': "Warning: sudo did not accept a password"})
+            except OSError:
+                pass
+
+        # Start direct downloads now so they overlap apt update and the
+        # package-manager jobs; each install job waits only for its own file
+        urls = [url for _, cmd in entries for url in download_urls(cmd)]
+        downloads = {}
+        cache = None
+        if urls:
+            from downloads import DownloadCache
+            cache = self._downloads = DownloadCache(max_workers=self.max_workers)
+            if self.cancel_requested:
+                cache.cancel()
+            downloads = cache.prefetch(urls)
+            for url, future in downloads.items():
+                future.add_done_callback(partial(self._on_download, url))
+
+        if self.os_type == 'linux' and entries and not self.bundle and not self.cancel_requested:
+            self.emit({'event': 'log', 'message': "Updating package lists..."})
+            with self.tracer.span("apt update") as span:
+                try:
+                    process = subprocess.run('sudo -n apt update', shell=True, capture_output=True)
+                    span['exit_code'] = process.returncode
+                except Exception:
+                    span['exit_code'] = -1
+            if span['exit_code'] != 0:
+                self.emit({'event': 'log', 'message': "Warning: Failed to update package lists"})
+
+        requires = {name: set(catalog.requires(name)) for name in self.selected}
+        sizes = {name: catalog.size(name) for name, _ in entries}
+
+        def fetch(url):
+            future = downloads.get(url)
+            if future is None or future.cancelled() or (future.done() and future.exception() is not None):
+                # Retrying after the prefetch failed: download again
+                return cache.fetch(url)
+            return future.result()
+
+        jobs = plan_jobs(entries, fetch=fetch, requires=requires, sizes=sizes, others=unavailable)
+        for name, reason in unavailable.items():
+            # Fails through the scheduler so whatever requires it fails too
+            job = Job(name, None)
+            job.action = partial(_unavailable, reason)
+            jobs.append(job)
+        estimate, path = critical_path(jobs)
+        self.emit({'event': 'plan', 'jobs': len(jobs), 'critical_path': [job.name for job in path],
+                   'estimate': estimate})
+        throttle = AdaptiveThrottle(self.max_workers, on_change=self._on_throttle) if self.adaptive else None
+        scheduler = Scheduler(self.max_workers, on_start=self._on_start, on_result=self._on_result,
+                              on_split=self._on_split, on_output=self._on_output, throttle=throttle,
+                              retry=self.retry, on_retry=self._on_retry,
+                              on_cancel=cache.cancel if cache else None)
+        self._scheduler = scheduler
+        if self.cancel_requested:
+            scheduler.cancel()
+        monitor = None
+        if throttle and jobs:
+            try:
+                monitor = self._monitor = ResourceMonitor(partial(self._on_sample, throttle, scheduler)).start()
+            except ImportError:
+                self.emit({'event': 'log', 'message': "Warning: psutil is not installed, not adapting to system load"})
+        keepalive = self._keepalive = SudoKeepAlive().start() if use_sudo and jobs else None
+        scheduler.run(jobs)
+        self._scheduler = None
+        # Also set if the run was interrupted (Ctrl-C) rather than cancel()ed
+        self.cancel_requested = self.cancel_requested or scheduler.cancelled
+        if monitor:
+            monitor.stop()
+        if keepalive:
+            keepalive.stop()
+        if jobs:
+            index.invalidate()
+        if cache:
+            cache.close()
+
+        if self.journal:
+            # A cancelled run stays resumable
+            if self.cancel_requested:
+                self.journal.close()
+            else:
+                self.journal.end()
+        self.emit({'event': 'summary', 'rows': self.tracer.summary()})
+        self.emit({'event': 'status', 'message': "Installation cancelled" if self.cancel_requested
+                   else "Installation complete!"})
+        installed = self.done - len(self.failed) - len(self.skipped) - len(self.cancelled)
+        self.emit({'event': 'complete', 'installed': installed, 'failed': len(self.failed),
+                   'skipped': len(self.skipped), 'cancelled': len(self.cancelled), 'failures': self.failures})
+        return not self.failed and not self.cancel_requested
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+import catalog
+from benchmark import write_stubs
+from bundle import Bundle, Bundler
+from catalog import compile_catalog
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="the package manager stubs are POSIX scripts")
+
+URL = 'https://downloads.example.com/pool/tool_1.0_amd64.deb'
+
+CATALOG = {
+    'categories': ['Dev'],
+    'software': [
+        {'name': 'Git', 'categories': ['Dev'], 'linux': 'sudo apt install git -y'},
+        {'name': 'Tool', 'categories': ['Dev'], 'requires': ['Git'],
+         'linux': f"wget {URL} && sudo dpkg -i tool_1.0_amd64.deb"},
+        {'name': 'Script', 'categories': ['Dev'], 'linux': 'curl -fsSL https://example.com/install.sh | sh'},
+    ],
+}
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    """A directory standing in for the download server, plus stub package managers on PATH"""
+    monkeypatch.setattr(catalog, '_catalog', compile_catalog(CATALOG))
+    bin_dir = str(tmp_path / 'bin')
+    write_stubs(bin_dir)
+    monkeypatch.setenv('PATH', bin_dir + os.pathsep + os.environ.get('PATH', ''))
+    monkeypatch.setenv('ZAPBENCH_SPAWN_LOG', str(tmp_path / 'spawn.log'))
+    monkeypatch.setenv('ZAPBENCH_DIR', str(tmp_path))
+    directory = tmp_path / 'mirror' / 'pool'
+    directory.mkdir(parents=True)
+    (directory / 'tool_1.0_amd64.deb').write_bytes(b'tool package' * 100)
+    return str(tmp_path / 'mirror')
+
+def test_bundle_round_trip(mirror, tmp_path):
+    root = str(tmp_path / 'bundle')
+    reported = {}
+    manifest = Bundler(root, 'linux', mirror=mirror, max_workers=2).create(
+        ['Tool', 'Script'], on_entry=lambda name, error: reported.update({name: error}))
+    assert manifest['packages'] == ['Git', 'Tool']
+    assert reported['Git'] is None and reported['Tool'] is None
+    assert 'cannot be staged' in manifest['unsupported']['Script']
+
+    bundle = Bundle(root)
+    assert bundle.os == 'linux'
+    assert bundle.verify() == {}
+    assert bundle.files_of('Tool') == ['files/downloads/tool_1.0_amd64.deb']
+
+    git = bundle.command('Git')
+    assert git == f"sudo apt install {os.path.join(root, 'files', 'apt', 'git_1.0_all.deb')} -y --no-download"
+    tool = bundle.command('Tool')
+    assert tool == f"sudo dpkg -i {os.path.join(root, 'files', 'downloads', 'tool_1.0_amd64.deb')}"
+    assert bundle.command('Script') is None
+
+def test_damaged_bundle_files_are_reported(mirror, tmp_path):
+    root = str(tmp_path / 'bundle')
+    Bundler(root, 'linux', mirror=mirror).create(['Tool'])
+    with open(os.path.join(root, 'files', 'downloads', 'tool_1.0_amd64.deb'), 'r+b') as f:
+        f.write(b'X')
+    os.remove(os.path.join(root, 'files', 'apt', 'git_1.0_all.deb'))
+
+    problems = Bundle(root).verify(['Tool', 'Git'])
+    assert problems['files/downloads/tool_1.0_amd64.deb'] == 'checksum mismatch'
+    assert problems['files/apt/git_1.0_all.deb'].startswith('unreadable')
+
+def test_not_a_bundle(tmp_path):
+    (tmp_path / 'manifest.json').write_text('{"format": 99}')
+    with pytest.raises(ValueError):
+        Bundle(str(tmp_path))
@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('requests')
+
+from downloads import DownloadCache, _url_key
+
+BODY = bytes(range(256)) * 64
+ETAG = '"v1"'
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves BODY with an ETag, honouring If-None-Match and If-Range/Range"""
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = BODY
+        byte_range = self.headers.get('Range')
+        if byte_range and self.headers.get('If-Range') == ETAG:
+            start = int(byte_range.split('=')[1].rstrip('-'))
+            if start >= len(BODY):
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(BODY)}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = BODY[start:]
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{len(BODY) - 1}/{len(BODY)}")
+        else:
+            self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def url_of(server):
+    return f"http://127.0.0.1:{server.server_port}/tool.deb"
+
+def write_partial(root, url, data, etag=ETAG):
+    partial = os.path.join(root, 'partial', _url_key(url))
+    os.makedirs(os.path.dirname(partial), exist_ok=True)
+    with open(partial, 'wb') as f:
+        f.write(data)
+    with open(partial + '.json', 'w') as f:
+        json.dump({'etag': etag, 'last_modified': None}, f)
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_fetch_then_revalidate(server, tmp_path):
+    url = url_of(server)
+    cache = DownloadCache(str(tmp_path))
+    path = cache.fetch(url)
+    assert read(path) == BODY
+    assert os.path.basename(path) == 'tool.deb'
+
+    # A new cache over the same directory revalidates instead of downloading
+    again = DownloadCache(str(tmp_path)).fetch(url)
+    assert again == path
+    assert server.requests[-1]['If-None-Match'] == ETAG
+
+def test_resume_with_range(server, tmp_path):
+    url = url_of(server)
+    write_partial(str(tmp_path), url, BODY[:1000])
+    path = DownloadCache(str(tmp_path)).fetch(url)
+    assert read(path) == BODY
+    assert server.requests[-1]['Range'] == 'bytes=1000-'
+    assert not os.listdir(tmp_path / 'partial')
+
+def test_unsatisfiable_range_restarts(server, tmp_path):
+    url = url_of(server)
+    write_partial(str(tmp_path), url, BODY + b'stale tail')
+    path = DownloadCache(str(tmp_path)).fetch(url)
+    assert read(path) == BODY
+    assert 'Range' in server.requests[0]
+    assert 'Range' not in server.requests[-1]
+
+def test_prefetch_shares_one_download(server, tmp_path):
+    url = url_of(server)
+    cache = DownloadCache(str(tmp_path), max_workers=2)
+    futures = cache.prefetch([url, url])
+    assert list(futures) == [url]
+    assert read(futures[url].result(timeout=10)) == BODY
+    cache.close()
+
+def test_cancelled_cache_does_not_fetch(server, tmp_path):
+    cache = DownloadCache(str(tmp_path))
+    cache.cancel()
+    with pytest.raises(RuntimeError):
+        cache.fetch(url_of(server))
+    assert cache.prefetch([url_of(server)]) == {}
+    assert not server.requests
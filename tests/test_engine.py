@@ -0,0 +1,70 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from engine import Job, Scheduler
+from failures import RetryPolicy
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="jobs are POSIX shell commands")
+
+def by_name(results):
+    return {result.job.name: result for result in results}
+
+def test_jobs_run_concurrently():
+    start = time.monotonic()
+    results = Scheduler(4).run([Job('a', 'sleep 0.3'), Job('b', 'sleep 0.3'), Job('c', 'sleep 0.3')])
+    assert all(result.ok for result in results)
+    assert time.monotonic() - start < 0.8
+
+def test_lane_runs_one_job_at_a_time():
+    results = by_name(Scheduler(4).run([Job('a', 'sleep 0.2', lane='dpkg'), Job('b', 'sleep 0.2', lane='dpkg')]))
+    first, second = sorted(results.values(), key=lambda result: result.started)
+    assert second.started >= first.started + first.duration
+
+def test_job_waits_for_its_prerequisites():
+    results = by_name(Scheduler(4).run([Job('b', 'true', requires={'a'}), Job('a', 'sleep 0.2')]))
+    assert results['b'].ok
+    assert results['b'].started >= results['a'].started + results['a'].duration
+
+def test_failed_prerequisite_fails_dependents_without_running():
+    results = by_name(Scheduler(4).run([Job('a', 'exit 3'), Job('b', 'touch /nonexistent/b', requires={'a'}),
+                                        Job('c', 'true', requires={'b'})]))
+    assert results['a'].returncode == 3
+    assert not results['b'].ok and 'prerequisite failed: a' in results['b'].stderr
+    assert not results['c'].ok and 'prerequisite failed: b' in results['c'].stderr
+
+def test_output_is_streamed():
+    lines = []
+    Scheduler(1, on_output=lambda job, stream, line: lines.append((stream, line))).run(
+        [Job('a', 'echo out; echo err >&2')])
+    assert sorted(lines) == [('stderr', 'err'), ('stdout', 'out')]
+
+def test_batch_is_retried_before_it_is_split():
+    events = []
+    batch = Job('x, y', 'exit 1', packages=['x', 'y'], fallback=[Job('x', 'true'), Job('y', 'exit 1')])
+    scheduler = Scheduler(2, retry=RetryPolicy(attempts={'other': 1}, base_delay=0.01),
+                          on_retry=lambda result, delay: events.append(('retry', result.job.name)),
+                          on_split=lambda result: events.append(('split', result.job.name)),
+                          on_result=lambda result: events.append(('result', result.job.name, result.ok)))
+    scheduler.run([batch])
+    assert events[:2] == [('retry', 'x, y'), ('split', 'x, y')]
+    assert ('result', 'x', True) in events
+    assert ('retry', 'y') in events
+    assert events[-1] == ('result', 'y', False)
+    assert not any(event[0] == 'result' and event[1] == 'x, y' for event in events)
+
+def test_cancel_stops_running_and_pending_jobs():
+    blocked = threading.Event()
+    action = Job('download', None)
+    action.action = lambda: blocked.wait(30)
+    jobs = [Job('a', 'sleep 30'), action, Job('b', 'sleep 30'), Job('c', 'true', lane='dpkg')]
+    scheduler = Scheduler(3, on_cancel=blocked.set)
+    threading.Timer(0.3, scheduler.cancel).start()
+    start = time.monotonic()
+    results = by_name(scheduler.run(jobs))
+    assert time.monotonic() - start < 5
+    assert scheduler.cancelled
+    assert blocked.is_set()
+    assert all(results[name].failure == 'cancelled' for name in ('a', 'download', 'b'))
@@ -0,0 +1,36 @@
+from journal import Journal, unfinished
+
+def test_interrupted_run_lists_what_did_not_install(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = Journal(path).begin(['A', 'B', 'C', 'D'])
+    journal.skipped(['A'])
+    journal.started(['B', 'C'])
+    journal.finished(['B'], True)
+    journal.finished(['C'], False)
+    journal.close()
+    assert unfinished(path) == ['C', 'D']
+
+def test_finished_run_has_nothing_to_resume(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = Journal(path).begin(['A', 'B'])
+    journal.finished(['A'], False)
+    journal.end()
+    assert unfinished(path) == []
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = Journal(path).begin(['A', 'B'])
+    journal.finished(['A'], True)
+    journal.close()
+    with open(path, 'a') as f:
+        f.write('{"op": "succeeded", "packa')
+    assert unfinished(path) == ['B']
+
+def test_begin_replaces_the_last_run(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    Journal(path).begin(['A']).close()
+    Journal(path).begin(['B']).close()
+    assert unfinished(path) == ['B']
+
+def test_missing_journal(tmp_path):
+    assert unfinished(str(tmp_path / 'none.jsonl')) == []
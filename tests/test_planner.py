@@ -0,0 +1,38 @@
+from planner import download_urls, localize_command, plan_jobs
+
+def test_same_backend_entries_are_batched():
+    jobs = plan_jobs([('Git', 'sudo apt install git -y'), ('Curl', 'sudo apt install curl -y'),
+                      ('Code', 'sudo snap install code --classic')])
+    batch, code = jobs
+    assert batch.packages == ['Git', 'Curl']
+    assert batch.cmd == 'sudo apt install git curl -y'
+    assert batch.lane == 'dpkg'
+    assert [job.cmd for job in batch.fallback] == ['sudo apt install git -y', 'sudo apt install curl -y']
+    assert code.packages == ['Code'] and not code.fallback and code.lane is None
+
+def test_dependent_entries_are_not_batched_together():
+    jobs = plan_jobs([('Base', 'sudo apt install base -y'), ('Tool', 'sudo apt install tool -y')],
+                     requires={'Tool': {'Base'}})
+    assert [job.packages for job in jobs] == [['Base'], ['Tool']]
+    assert jobs[1].requires == {'Base'}
+
+def test_requirements_on_other_jobs_are_kept():
+    jobs = plan_jobs([('Tool', 'sudo apt install tool -y')], requires={'Tool': {'Missing'}}, others=['Missing'])
+    assert jobs[0].requires == {'Missing'}
+
+def test_direct_download_gets_its_own_job():
+    url = 'https://example.com/pkg/tool.deb'
+    cmd = f"wget {url} && sudo dpkg -i tool.deb"
+    assert download_urls(cmd) == [url]
+    download, install = plan_jobs([('Tool', cmd)], fetch=lambda url: '/cache/tool.deb')
+    assert download.packages == [] and download.provides == {f"download:{url}"}
+    assert download.action() == '/cache/tool.deb'
+    assert install.requires == {f"download:{url}"}
+    assert install.prepare() == 'sudo dpkg -i /cache/tool.deb'
+    assert localize_command(cmd, lambda url: '/x.deb') == 'sudo dpkg -i /x.deb'
+
+def test_sizes_are_summed_per_job():
+    jobs = plan_jobs([('Git', 'sudo apt install git -y'), ('Curl', 'sudo apt install curl -y')],
+                     sizes={'Git': 30, 'Curl': 5})
+    assert jobs[0].size == 35
+    assert [job.size for job in jobs[0].fallback] == [30, 5]
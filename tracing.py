@@ -0,0 +1,103 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+from catalog import CACHE_DIR
+
+TRACE_PATH = os.path.join(CACHE_DIR, 'last-run.trace.jsonl')
+
+class Tracer:
+    """Collects timed spans for one install run.
+
+    Each span has a name, a category ('phase' for whole-run steps like the
+    backend probes or apt update, 'job' for an install job, 'wait' for the
+    time a job spent queued), start/end times from time.monotonic() and
+    free-form args such as the exit code.
+
+    Counters are point-in-time readings (e.g. CPU % or free disk) recorded
+    alongside the spans, so resource use can be lined up with the jobs.
+    """
+
+    def __init__(self):
+        self.origin = time.monotonic()
+        self.wall_origin = time.time()
+        self.spans = []
+        self.counters = []
+        self._lock = Lock()
+
+    def record(self, name, cat, start, end, **args):
+        with self._lock:
+            self.spans.append({'name': name, 'cat': cat, 'start': start - self.origin,
+                               'dur': max(0.0, end - start), 'args': args})
+
+    def counter(self, name, at, **values):
+        with self._lock:
+            self.counters.append({'name': name, 'cat': 'counter', 'start': at - self.origin, 'args': values})
+
+    @contextmanager
+    def span(self, name, cat='phase', **args):
+        """Time a block; the yielded dict can be filled with extra args"""
+        start = time.monotonic()
+        try:
+            yield args
+        finally:
+            self.record(name, cat, start, time.monotonic(), **args)
+
+    def write_jsonl(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            for span in sorted(self.spans + self.counters, key=lambda s: s['start']):
+                record = {'ts': round(self.wall_origin + span['start'], 6), 'name': span['name'],
+                          'cat': span['cat']}
+                if 'dur' in span:
+                    record['dur'] = round(span['dur'], 6)
+                record.update(span['args'])
+                f.write(json.dumps(record) + '\n')
+
+    def write_chrome(self, path):
+        """Write the spans in Chrome trace-event format (chrome://tracing, Perfetto)"""
+        pid = os.getpid()
+        rows = []
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'zapinstall'}}]
+        for span in sorted(self.spans, key=lambda s: s['start']):
+            # Pack overlapping spans onto separate rows so parallel jobs
+            # show up side by side instead of on top of each other
+            end = span['start'] + span['dur']
+            for tid, busy_until in enumerate(rows):
+                if busy_until <= span['start']:
+                    rows[tid] = end
+                    break
+            else:
+                tid = len(rows)
+                rows.append(end)
+            events.append({'name': span['name'], 'cat': span['cat'], 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': round(span['start'] * 1e6), 'dur': round(span['dur'] * 1e6),
+                           'args': span['args']})
+        for counter in self.counters:
+            events.append({'name': counter['name'], 'ph': 'C', 'pid': pid, 'ts': round(counter['start'] * 1e6),
+                           'args': counter['args']})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def summary(self):
+        """Rows of (name, wait seconds, run seconds, exit code) for phases and jobs"""
+        rows = []
+        for span in sorted(self.spans, key=lambda s: s['start']):
+            if span['cat'] == 'phase':
+                rows.append((span['name'], None, span['dur'], span['args'].get('exit_code')))
+            elif span['cat'] == 'job':
+                rows.append((span['name'], span['args'].get('wait'), span['dur'], span['args'].get('exit_code')))
+        return rows
+
+def format_summary(rows):
+    """Render summary rows as a fixed-width text table"""
+    width = max([len('Step')] + [len(name) for name, _, _, _ in rows])
+    width = min(width, 40)
+    lines = [f"{'Step':<{width}}  {'Wait':>7}  {'Run':>7}  Exit"]
+    for name, wait, run, exit_code in rows:
+        wait_text = f"{wait:6.1f}s" if wait is not None else ''
+        exit_text = '' if exit_code is None else str(exit_code)
+        lines.append(f"{name[:width]:<{width}}  {wait_text:>7}  {run:6.1f}s  {exit_text}")
+    return '\n'.join(lines)
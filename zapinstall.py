@@ -0,0 +1,291 @@
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import json
+import sys
+from threading import Lock
+
+from bundle import Bundle, Bundler
+from catalog import current_os, find_command, get_catalog
+from engine import DEFAULT_JOBS, MAX_JOBS
+from inventory import InstalledIndex, required_backends
+from journal import Journal, unfinished
+from profiles import delete_profile, export_profile, list_profiles, load_profile, read_profile, save_profile
+from session import InstallSession, describe
+
+def startup_ms():
+    return round((time.perf_counter() - _STARTED) * 1000, 2)
+
+class Reporter:
+    """Writes install events to stdout as text or JSON lines"""
+
+    def __init__(self, as_json=False, stream=sys.stdout):
+        self.as_json = as_json
+        self.stream = stream
+        self._lock = Lock()
+
+    def __call__(self, event):
+        if self.as_json:
+            line = json.dumps(event)
+        else:
+            line = describe(event)
+            if line is None:
+                return
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+def check_selection(selected, os_type=None):
+    """Usage error for a list of entry names, or None if it can be installed on os_type"""
+    if not selected:
+        return "nothing to install"
+    catalog = get_catalog()
+    unknown = [name for name in selected if name not in catalog]
+    if unknown:
+        return f"not in catalog: {', '.join(unknown)}"
+    os_type = os_type or current_os()
+    commandless = [name for name in selected if not catalog.command(name, os_type)]
+    if commandless:
+        return f"no command for {os_type}: {', '.join(commandless)}"
+    try:
+        get_catalog().resolve(selected)
+    except ValueError as e:
+        return str(e)
+    return None
+
+def selection_from_args(args, extra=(), os_type=None):
+    """Entry names from args.packages, the profile in args.profile and extra, deduplicated.
+
+    Returns None after printing why they cannot be used (an unreadable
+    profile, or names check_selection rejects for os_type).
+    """
+    selected = list(getattr(args, 'packages', ()))
+    if args.profile:
+        try:
+            selected += load_profile(args.profile)
+        except (OSError, ValueError) as e:
+            print(f"zapinstall: cannot read profile: {e}", file=sys.stderr)
+            return None
+    selected = list(dict.fromkeys(selected + list(extra)))
+    error = check_selection(selected, os_type)
+    if error:
+        print(f"zapinstall: {error}", file=sys.stderr)
+        return None
+    return selected
+
+def run_install(selected, args, bundle=None):
+    reporter = Reporter(args.json)
+    reporter({'event': 'ready', 'startup_ms': startup_ms(), 'packages': len(selected)})
+    session = InstallSession(selected, reporter, args.jobs, adaptive=args.adaptive, journal=Journal(),
+                             retry=args.retry, bundle=bundle)
+    try:
+        # Ctrl-C while jobs run cancels them and still reports the run;
+        # earlier than that there is nothing to clean up
+        ok = session.run()
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        # e.g. an unwritable journal or a failing installed-package check
+        print(f"zapinstall: installation failed: {e}", file=sys.stderr)
+        return 1
+    if args.trace:
+        session.tracer.write_jsonl(args.trace)
+    if args.chrome_trace:
+        session.tracer.write_chrome(args.chrome_trace)
+    if session.cancel_requested:
+        return 130
+    return 0 if ok else 1
+
+def open_bundle(path):
+    """The Bundle at path, or None after printing why it cannot be installed from here"""
+    try:
+        bundle = Bundle(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"zapinstall: cannot read bundle: {e}", file=sys.stderr)
+        return None
+    if bundle.os != current_os():
+        print(f"zapinstall: bundle is for {bundle.os}, this machine needs {current_os()}", file=sys.stderr)
+        return None
+    return bundle
+
+def cmd_install(args):
+    bundle = None
+    if args.from_bundle:
+        bundle = open_bundle(args.from_bundle)
+        if bundle is None:
+            return 2
+    named = args.packages or args.profile
+    extra = []
+    if args.resume:
+        extra = unfinished()
+        if not extra and not named:
+            print("zapinstall: no interrupted run to resume", file=sys.stderr)
+            return 0
+    if bundle and not named and not extra:
+        extra = bundle.packages
+    selected = selection_from_args(args, extra)
+    if selected is None:
+        return 2
+    return run_install(selected, args, bundle)
+
+def cmd_bundle(args):
+    selected = selection_from_args(args, os_type=args.os)
+    if selected is None:
+        return 2
+    lock = Lock()
+
+    def report(name, error):
+        with lock:
+            print(f"✓ {name}" if error is None else f"❌ {name}: {error}", flush=True)
+
+    bundler = Bundler(args.directory, args.os, mirror=args.mirror, max_workers=args.jobs)
+    manifest = bundler.create(selected, on_entry=report)
+    size = sum(f['size'] for f in manifest['files'].values())
+    print(f"\nBundled {len(manifest['entries'])} entries ({len(manifest['files'])} files, {size / 2**20:.1f} MB) "
+          f"into {args.directory}")
+    if manifest['unsupported']:
+        print(f"{len(manifest['unsupported'])} could not be bundled: {', '.join(manifest['unsupported'])}")
+        return 1
+    return 0
+
+def show_diff(selected, as_json=False):
+    """Print which entries (and prerequisites) are installed and which are missing"""
+    entries = [(name, find_command(name)) for name in get_catalog().resolve(selected)]
+    entries = [(name, cmd) for name, cmd in entries if cmd]
+    index = InstalledIndex().load(required_backends(cmd for _, cmd in entries))
+    for name, cmd in entries:
+        installed = index.is_installed(cmd)
+        if as_json:
+            print(json.dumps({'name': name, 'installed': installed}))
+        else:
+            print(f"{'installed' if installed else 'missing'}\t{name}")
+    return 0
+
+def cmd_apply(args):
+    selected = selection_from_args(args)
+    if selected is None:
+        return 2
+    if args.dry_run:
+        return show_diff(selected, args.json)
+    # Already-installed entries are skipped before anything is spawned, so
+    # a machine that matches the profile runs no package manager at all
+    return run_install(selected, args)
+
+def cmd_profile(args):
+    try:
+        if args.action == 'list':
+            for name in list_profiles():
+                print(name)
+        elif args.action == 'show':
+            for name in load_profile(args.name):
+                print(name)
+        elif args.action == 'save':
+            packages = list(args.packages)
+            if args.from_file:
+                packages += read_profile(args.from_file)
+            packages = list(dict.fromkeys(packages))
+            error = check_selection(packages)
+            if error:
+                print(f"zapinstall: {error}", file=sys.stderr)
+                return 2
+            save_profile(args.name, packages)
+        elif args.action == 'export':
+            export_profile(args.name, args.file)
+        elif args.action == 'delete':
+            delete_profile(args.name)
+    except (OSError, ValueError) as e:
+        print(f"zapinstall: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+def cmd_list(args):
+    catalog = get_catalog()
+    for name, entry in catalog.entries.items():
+        if args.json:
+            print(json.dumps({'name': name, 'categories': entry['categories'], 'command': entry.get(args.os)}))
+        else:
+            print(f"{', '.join(entry['categories'])}\t{name}")
+    return 0
+
+def add_selection_options(parser):
+    parser.add_argument('packages', nargs='*', help="catalog entry names, e.g. Git 'VS Code'")
+    parser.add_argument('--profile', help="saved profile name, or a profile file")
+
+def add_jobs_option(parser, what):
+    parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS, choices=range(1, MAX_JOBS + 1),
+                        metavar='N', help=f"{what} (default {DEFAULT_JOBS})")
+
+def add_run_options(parser):
+    add_jobs_option(parser, "parallel install jobs")
+    parser.add_argument('--no-throttle', dest='adaptive', action='store_false',
+                        help="always run --jobs jobs, ignoring CPU, memory and disk pressure")
+    parser.add_argument('--no-retry', dest='retry', action='store_false',
+                        help="do not retry installs that failed on a held lock or a network error")
+    parser.add_argument('--json', action='store_true', help="stream progress as JSON lines")
+    parser.add_argument('--trace', metavar='FILE', help="write per-phase and per-job timings as JSON lines")
+    parser.add_argument('--chrome-trace', metavar='FILE',
+                        help="write timings in Chrome trace-event format (chrome://tracing, Perfetto)")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='zapinstall', description="Install common software from the command line. "
+                                     "Run without a command to open the graphical installer.")
+    commands = parser.add_subparsers(dest='command')
+
+    install = commands.add_parser('install', help="install catalog entries without the GUI")
+    add_selection_options(install)
+    install.add_argument('--resume', action='store_true',
+                         help="also install what an interrupted run left unfinished")
+    install.add_argument('--from-bundle', metavar='DIR',
+                         help="install only from the files of a bundle (default: everything in it)")
+    add_run_options(install)
+    install.set_defaults(func=cmd_install)
+
+    apply = commands.add_parser('apply', help="install whatever a profile lists that is not installed yet")
+    apply.add_argument('profile', help="saved profile name, or a profile file")
+    apply.add_argument('--dry-run', action='store_true', help="only show what is installed and what is missing")
+    add_run_options(apply)
+    apply.set_defaults(func=cmd_apply)
+
+    bundle = commands.add_parser('bundle', help="download installers into a directory for offline installs")
+    bundle.add_argument('directory', help="directory to write the bundle to")
+    add_selection_options(bundle)
+    bundle.add_argument('--os', choices=('cmd', 'linux', 'mac'), default=current_os(),
+                        help="platform the bundle is for (default: the current one)")
+    bundle.add_argument('--mirror', metavar='URL_OR_DIR',
+                        help="fetch direct downloads from this base URL or directory instead of their hosts")
+    add_jobs_option(bundle, "entries staged in parallel")
+    bundle.set_defaults(func=cmd_bundle)
+
+    profile = commands.add_parser('profile', help="manage saved selection profiles")
+    actions = profile.add_subparsers(dest='action', required=True)
+    actions.add_parser('list', help="list saved profiles")
+    actions.add_parser('show', help="list a profile's entries").add_argument('name')
+    save = actions.add_parser('save', help="save catalog entries as a named profile")
+    save.add_argument('name')
+    save.add_argument('packages', nargs='*', help="catalog entry names")
+    save.add_argument('--from', dest='from_file', metavar='FILE', help="also take entries from a profile file")
+    export = actions.add_parser('export', help="write a saved profile to a file")
+    export.add_argument('name')
+    export.add_argument('file')
+    actions.add_parser('delete', help="delete a saved profile").add_argument('name')
+    profile.set_defaults(func=cmd_profile)
+
+    listing = commands.add_parser('list', help="list the software catalog")
+    listing.add_argument('--json', action='store_true', help="print one JSON object per entry")
+    listing.add_argument('--os', choices=('cmd', 'linux', 'mac'), default=current_os(),
+                         help="show commands for this platform (default: the current one)")
+    listing.set_defaults(func=cmd_list)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        from installer import main as gui_main
+        gui_main()
+        return 0
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())